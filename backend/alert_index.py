@@ -0,0 +1,252 @@
+"""
+Process-local index of open alerts for the police nearby feed.
+
+Pending alerts are bucketed by geohash cell so a nearby poll only touches the
+cells around the officer; alerts an officer is responding to are kept per
+officer. The index is updated on every alert write path through
+alert_changed(), which also publishes a Postgres NOTIFY so the other workers
+reload that alert. A periodic reconciliation sweep rebuilds the index from the
+database as a safety net for anything missed (e.g. a dropped listener).
+"""
+
+import os
+import select
+import threading
+import time
+import logging
+import uuid
+import psycopg2
+import psycopg2.extensions
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+from . import models, utils
+from .database import SessionLocal, engine, SQLALCHEMY_DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "alert_index"
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("ALERT_INDEX_RECONCILE_SECONDS", 60))
+INDEX_CELL_PRECISION = 4  # ~39km x 19km buckets
+
+# Identifies this process in NOTIFY payloads so it can skip its own messages
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+# Sender block for AlertForPolice: joined in the same query, only the CitizenInfo columns
+SENDER_PROJECTION = joinedload(models.Alert.user).load_only(
+    models.User.id, models.User.full_name, models.User.cnic, models.User.email,
+    models.User.phone, models.User.address, models.User.gender
+)
+
+
+def snapshot(alert: models.Alert, sender: Optional[models.User] = None) -> dict:
+    """AlertForPolice payload (without distance) plus the fields the index keys on"""
+    sender = sender or alert.user
+    return {
+        "id": alert.id, "alert_type": alert.alert_type, "content": alert.content,
+        "audio_url": alert.audio_url, "created_at": alert.created_at,
+        "latitude": alert.latitude, "longitude": alert.longitude,
+        "tag": alert.tag, "status": alert.status,
+        "sender": {
+            "id": sender.id,
+            "full_name": sender.full_name,
+            "cnic_masked": utils.mask_cnic(sender.cnic),
+            "email": sender.email,
+            "phone": sender.phone,
+            "address": sender.address,
+            "gender": sender.gender
+        } if sender else None,
+        # Transcription fields
+        "transcription": alert.transcription,
+        "transcription_keywords": alert.transcription_keywords,
+        "transcription_status": alert.transcription_status or 'none',
+        # Index keys
+        "responded_by": alert.responded_by,
+        "geo_cell": alert.geo_cell,
+    }
+
+
+class PendingAlertIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cells: Dict[str, Dict[int, dict]] = {}
+        self._responding: Dict[int, Dict[int, dict]] = {}
+        self._location: Dict[int, tuple] = {}  # alert_id -> ('cell', key) or ('officer', key)
+        # Changes made while a rebuild is loading, replayed on top of its result
+        self._journal: Optional[List[tuple]] = None
+        self.ready = False
+
+    def upsert(self, entry: dict):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(('upsert', entry))
+            self._discard(entry["id"])
+            if entry["status"] == 'pending' and entry["geo_cell"]:
+                cell = entry["geo_cell"][:INDEX_CELL_PRECISION]
+                self._cells.setdefault(cell, {})[entry["id"]] = entry
+                self._location[entry["id"]] = ('cell', cell)
+            elif entry["status"] == 'responded' and entry["responded_by"]:
+                officer_id = entry["responded_by"]
+                self._responding.setdefault(officer_id, {})[entry["id"]] = entry
+                self._location[entry["id"]] = ('officer', officer_id)
+
+    def remove(self, alert_id: int):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(('remove', alert_id))
+            self._discard(alert_id)
+
+    def replace_all(self, entries: List[dict]):
+        self.rebuild(lambda: entries)
+
+    def rebuild(self, load: Callable[[], List[dict]]):
+        """
+        Replace the index with the entries load() reads from the database.
+        Upserts and removals that land while load() runs are newer than its
+        snapshot, so they are replayed on top instead of being overwritten.
+        """
+        with self._lock:
+            self._journal = []
+        try:
+            entries = load()
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+        fresh = PendingAlertIndex()
+        for entry in entries:
+            fresh.upsert(entry)
+        with self._lock:
+            for operation, argument in self._journal:
+                if operation == 'upsert':
+                    fresh.upsert(argument)
+                else:
+                    fresh.remove(argument)
+            self._journal = None
+            self._cells, self._responding, self._location = fresh._cells, fresh._responding, fresh._location
+            self.ready = True
+
+    def pending_in_cells(self, prefixes: List[str]) -> List[dict]:
+        """Pending alerts whose cell starts with any of the given geohash prefixes"""
+        with self._lock:
+            found = {}
+            for prefix in prefixes:
+                if len(prefix) >= INDEX_CELL_PRECISION:
+                    bucket = self._cells.get(prefix[:INDEX_CELL_PRECISION], {})
+                    found.update((k, v) for k, v in bucket.items() if v["geo_cell"].startswith(prefix))
+                else:
+                    for cell, bucket in self._cells.items():
+                        if cell.startswith(prefix):
+                            found.update(bucket)
+            return list(found.values())
+
+    def is_pending(self, alert_id: int) -> bool:
+        with self._lock:
+            location = self._location.get(alert_id)
+            return location is not None and location[0] == 'cell'
+
+    def responding(self, officer_id: int) -> List[dict]:
+        with self._lock:
+            return list(self._responding.get(officer_id, {}).values())
+
+    def _discard(self, alert_id: int):
+        location = self._location.pop(alert_id, None)
+        if location is None:
+            return
+        kind, key = location
+        buckets = self._cells if kind == 'cell' else self._responding
+        bucket = buckets.get(key)
+        if bucket is not None:
+            bucket.pop(alert_id, None)
+            if not bucket:
+                del buckets[key]
+
+
+pending_alerts = PendingAlertIndex()
+
+
+def open_alerts_query(db):
+    return db.query(models.Alert).options(SENDER_PROJECTION).filter(
+        models.Alert.status.in_(['pending', 'responded'])
+    )
+
+
+def reconcile():
+    """Rebuild the whole index from the database"""
+    db = SessionLocal()
+    try:
+        pending_alerts.rebuild(lambda: [snapshot(a) for a in open_alerts_query(db).all()])
+    finally:
+        db.close()
+
+
+def reload_alert(alert_id: int):
+    db = SessionLocal()
+    try:
+        alert = open_alerts_query(db).filter(models.Alert.id == alert_id).first()
+        if alert:
+            pending_alerts.upsert(snapshot(alert))
+        else:
+            pending_alerts.remove(alert_id)
+    finally:
+        db.close()
+
+
+def alert_changed(alert: models.Alert, sender: Optional[models.User] = None):
+    """
+    Call after committing any change to an alert's status, location or content.
+    Updates this worker's index and tells the other workers to reload the alert.
+    """
+    try:
+        if alert.status in ('pending', 'responded'):
+            pending_alerts.upsert(snapshot(alert, sender))
+        else:
+            pending_alerts.remove(alert.id)
+    except Exception as e:
+        logger.error(f"Alert index update failed for alert {alert.id}: {e}")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                         {"channel": NOTIFY_CHANNEL, "payload": f"{_PROCESS_TOKEN}:{alert.id}"})
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Alert index notify failed for alert {alert.id}: {e}")
+
+
+def _listen_loop():
+    """LISTEN for changes made by other workers and reconcile periodically"""
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(SQLALCHEMY_DATABASE_URL)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL};")
+            # Anything published while we were not listening is picked up here
+            reconcile()
+            next_reconcile = time.monotonic() + RECONCILE_INTERVAL_SECONDS
+            while True:
+                timeout = max(next_reconcile - time.monotonic(), 0)
+                if select.select([conn], [], [], timeout) != ([], [], []):
+                    conn.poll()
+                    while conn.notifies:
+                        token, _, alert_id = conn.notifies.pop(0).payload.rpartition(":")
+                        if token != _PROCESS_TOKEN:
+                            reload_alert(int(alert_id))
+                if time.monotonic() >= next_reconcile:
+                    reconcile()
+                    next_reconcile = time.monotonic() + RECONCILE_INTERVAL_SECONDS
+        except Exception as e:
+            logger.error(f"Alert index listener error: {e}")
+            pending_alerts.ready = False
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def start_index():
+    thread = threading.Thread(target=_listen_loop, daemon=True)
+    thread.start()
@@ -0,0 +1,112 @@
+"""
+Single path for creating alerts.
+
+Every producer (POST /alerts, the Safe Walk panic button, the Safe Walk
+expiry monitor) builds its alert with build_alert() and calls publish() after
+committing it. publish() updates the open-alert index and starts officer
+dispatch on the server's event loop, whether it is called from a coroutine,
+a sync route running in the threadpool or a background thread.
+"""
+
+import asyncio
+import threading
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+from . import models, schemas, utils, alert_index, dispatch
+from .socket_manager import sio, geo_room_for
+
+logger = logging.getLogger(__name__)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+# Alerts published before the event loop was bound (e.g. overdue Safe Walks at startup)
+_early: List[Tuple[dict, Optional[float], Optional[float]]] = []
+
+
+def bind_loop(loop: asyncio.AbstractEventLoop):
+    """Register the server's event loop; call once from an async startup hook"""
+    global _loop
+    with _lock:
+        _loop = loop
+        early, _early[:] = list(_early), []
+    for args in early:
+        loop.call_soon_threadsafe(dispatch.start_dispatch, *args)
+
+
+def build_alert(user_id: int, alert_type: str, latitude: Optional[float], longitude: Optional[float],
+                content: Optional[str] = None, audio_url: Optional[str] = None, tag: str = 'police',
+                safe_walk_session_id: Optional[int] = None) -> models.Alert:
+    # Voice alerts with audio are transcribed in the background
+    transcription_status = 'pending' if alert_type == 'voice' and audio_url else 'none'
+    return models.Alert(
+        user_id=user_id,
+        alert_type=alert_type,
+        content=content,
+        audio_url=audio_url,
+        latitude=latitude,
+        longitude=longitude,
+        geo_cell=utils.geo_cell_for(latitude, longitude),
+        tag=tag,
+        safe_walk_session_id=safe_walk_session_id,
+        status='pending',
+        transcription_status=transcription_status
+    )
+
+
+def alert_payload(alert: models.Alert) -> dict:
+    """JSON-safe AlertOut dict, as emitted in new_alert events"""
+    alert_data = schemas.AlertOut.from_orm(alert).dict()
+    for k, v in alert_data.items():
+        if isinstance(v, datetime): alert_data[k] = v.isoformat()
+    return alert_data
+
+
+def publish(alert: models.Alert, sender: Optional[models.User] = None):
+    """Call after committing a new alert: index it and push it to officers"""
+    alert_index.alert_changed(alert, sender=sender)
+    args = (alert_payload(alert), alert.latitude, alert.longitude)
+
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None:
+        dispatch.start_dispatch(*args)
+        return
+
+    with _lock:
+        loop = _loop
+        if loop is None:
+            _early.append(args)
+            return
+    try:
+        loop.call_soon_threadsafe(dispatch.start_dispatch, *args)
+    except RuntimeError as e:
+        # Loop already closed (shutdown); officers still see it on their next poll
+        logger.error(f"Could not dispatch alert {alert.id}: {e}")
+
+
+def alert_viewer_rooms(alert: models.Alert) -> List[str]:
+    """Rooms of everyone who may have the alert open: its sender, the responding officer, officers nearby"""
+    rooms = [f"user_{alert.user_id}"]
+    if alert.responded_by:
+        rooms.append(f"user_{alert.responded_by}")
+    if alert.latitude is not None and alert.longitude is not None:
+        rooms.append(geo_room_for(alert.latitude, alert.longitude))
+    return rooms
+
+
+def notify_viewers(alert: models.Alert, event: str, data: dict):
+    """Emit an update about an alert to its viewers; callable from any thread"""
+    rooms = alert_viewer_rooms(alert)
+    with _lock:
+        loop = _loop
+    if loop is None:
+        return
+
+    try:
+        # A list of rooms reaches each connected socket once, even if it is in several
+        asyncio.run_coroutine_threadsafe(sio.emit(event, data, room=rooms), loop)
+    except RuntimeError as e:
+        logger.error(f"Could not emit {event} for alert {alert.id}: {e}")
@@ -0,0 +1,70 @@
+"""
+Audio clean-up applied to decoded 16 kHz mono clips before Whisper.
+
+Voice SOS recordings often start and end with long silences. An energy-based
+voice activity check trims them (keeping a little padding), the clip is capped
+at TRANSCRIPTION_MAX_SECONDS, and the level is normalised, so the model only
+spends CPU on the part of the clip that contains speech.
+"""
+
+import os
+import numpy as np
+
+SAMPLE_RATE = 16000
+MAX_SECONDS = int(os.getenv("TRANSCRIPTION_MAX_SECONDS", 120))
+
+FRAME_MS = 30
+PAD_MS = 300
+# A frame counts as voiced when it is this far above the clip's noise floor
+# (its 10th-percentile frame energy), and never below the absolute floor
+VOICE_MARGIN_DB = 12.0
+ABSOLUTE_FLOOR_DB = -50.0
+PEAK_LEVEL = 0.9
+# Bump whenever a change here alters what the model hears, so cached
+# transcripts of the old clean-up are not reused
+PREPROCESSING_VERSION = 1
+
+
+def frame_energy_db(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """RMS level of each FRAME_MS frame in dBFS"""
+    frame = sample_rate * FRAME_MS // 1000
+    frames = len(audio) // frame
+    if frames == 0:
+        return np.empty(0)
+    rms = np.sqrt(np.mean(audio[:frames * frame].reshape(frames, frame) ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def trim_silence(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Drop leading and trailing silence; returns an empty array if nothing is voiced"""
+    energy = frame_energy_db(audio, sample_rate)
+    if len(energy) == 0:
+        return audio
+    threshold = max(np.percentile(energy, 10) + VOICE_MARGIN_DB, ABSOLUTE_FLOOR_DB)
+    voiced = np.flatnonzero(energy > threshold)
+    if len(voiced) == 0:
+        # Uniform level throughout: either steady speech or steady noise, keep it
+        return audio if energy.max() > ABSOLUTE_FLOOR_DB else audio[:0]
+    frame = sample_rate * FRAME_MS // 1000
+    pad = sample_rate * PAD_MS // 1000
+    start = max(voiced[0] * frame - pad, 0)
+    end = min((voiced[-1] + 1) * frame + pad, len(audio))
+    return audio[start:end]
+
+
+def normalize(audio: np.ndarray) -> np.ndarray:
+    """Remove DC offset and scale the peak to PEAK_LEVEL"""
+    audio = audio - audio.mean()
+    peak = np.abs(audio).max()
+    if peak > 0:
+        audio = audio * (PEAK_LEVEL / peak)
+    return audio.astype(np.float32)
+
+
+def preprocess(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Trim, cap and normalise a decoded mono float32 clip"""
+    audio = np.asarray(audio, dtype=np.float32)
+    audio = trim_silence(audio, sample_rate)[:MAX_SECONDS * sample_rate]
+    if len(audio) == 0:
+        return audio
+    return normalize(audio)
@@ -0,0 +1,106 @@
+"""
+Compare transcription backends on sample clips.
+
+Run from the repository root:
+
+    python -m backend.benchmark_transcription backend/uploads/audio \
+        whisper:tiny faster-whisper:tiny faster-whisper:base --threads 4
+
+Every clip is decoded and preprocessed once, exactly as in production, then
+transcribed by each backend after a warm-up run. Accuracy is the word error
+rate against a reference transcript: <clip>.txt next to the clip if present,
+otherwise the first backend's output. Latency is per clip, and the real-time
+factor is processing time divided by audio duration (lower is faster).
+"""
+
+import argparse
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from . import audio_preprocessing, transcription_backends
+
+AUDIO_EXTENSIONS = {".m4a", ".mp3", ".wav", ".ogg", ".webm", ".aac", ".flac"}
+
+
+def normalize_words(text: str) -> List[str]:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length"""
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips", help="Directory of audio clips")
+    parser.add_argument("backends", nargs="+", help="backend:model pairs, e.g. whisper:tiny faster-whisper:base")
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads per backend (0 = library default)")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.clips).iterdir() if p.suffix.lower() in AUDIO_EXTENSIONS)
+    if not paths:
+        parser.error(f"No audio clips in {args.clips}")
+
+    specs = [spec.split(":", 1) if ":" in spec else (spec, transcription_backends.DEFAULT_MODEL)
+             for spec in args.backends]
+    backends = {}
+    load_seconds = {}
+    for name, model_size in specs:
+        start = time.perf_counter()
+        backend = transcription_backends.load_backend(name, model_size, args.threads)
+        load_seconds[repr(backend)] = time.perf_counter() - start
+        backends[repr(backend)] = backend
+
+    # Decode once with the first backend so every engine sees identical input
+    decoder = next(iter(backends.values()))
+    clips = {}
+    for path in paths:
+        audio = audio_preprocessing.preprocess(decoder.decode(str(path)))
+        if len(audio):
+            clips[path] = audio
+    total_audio = sum(len(a) for a in clips.values()) / audio_preprocessing.SAMPLE_RATE
+    print(f"{len(clips)} clips with speech, {total_audio:.1f}s of audio after trimming\n")
+
+    outputs: Dict[str, Dict[Path, str]] = {}
+    latencies: Dict[str, List[float]] = {}
+    for label, backend in backends.items():
+        backend.transcribe(np.zeros(audio_preprocessing.SAMPLE_RATE, dtype=np.float32))  # warm-up
+        outputs[label], latencies[label] = {}, []
+        for path, audio in clips.items():
+            start = time.perf_counter()
+            outputs[label][path] = backend.transcribe(audio)
+            latencies[label].append(time.perf_counter() - start)
+
+    first = next(iter(backends))
+    references = {}
+    for path in clips:
+        reference_file = path.with_suffix(".txt")
+        references[path] = reference_file.read_text() if reference_file.exists() else outputs[first][path]
+    reference_note = "reference transcripts" if all(p.with_suffix(".txt").exists() for p in clips) else f"{first} output"
+
+    print(f"{'backend':<28}{'load s':>8}{'mean s':>9}{'p95 s':>8}{'RTF':>7}{'WER':>8}")
+    for label in backends:
+        runs = latencies[label]
+        p95 = sorted(runs)[min(len(runs) - 1, int(len(runs) * 0.95))] if runs else 0.0
+        wer = statistics.mean(word_error_rate(references[p], outputs[label][p]) for p in clips) if clips else 0.0
+        rtf = sum(runs) / total_audio if total_audio else 0.0
+        print(f"{label:<28}{load_seconds[label]:>8.1f}{statistics.mean(runs) if runs else 0:>9.2f}"
+              f"{p95:>8.2f}{rtf:>7.2f}{wer:>8.1%}")
+    print(f"\nWER is measured against {reference_note}.")
+
+
+if __name__ == "__main__":
+    main()
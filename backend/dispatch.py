@@ -0,0 +1,256 @@
+"""
+Nearest-available-officer dispatch.
+
+New alerts are first pushed to the k nearest approved officers that reported
+a location recently (through their user_{id} rooms). If nobody has claimed
+the alert when a stage times out, the search radius widens, then the alert
+goes to the geo room around it (every connected officer in the neighbouring
+cells). Only an alert still unclaimed after that is broadcast to police_all.
+
+Officer positions live in an in-memory grid keyed by geohash cell, so a
+lookup only scans the cells around the alert. The grid is fed by location
+updates on this worker and reloaded from the database periodically, which
+also picks up positions reported to other workers and approval changes.
+"""
+
+import asyncio
+import os
+import threading
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from . import models, utils
+from .database import SessionLocal
+from .alert_index import pending_alerts
+from .location_buffer import location_buffer
+from .socket_manager import sio, geo_room_for, local_officer_ids, place_officer, disconnect_officer
+
+logger = logging.getLogger(__name__)
+
+OFFICER_CELL_PRECISION = 4  # ~39km x 19km buckets
+OFFICER_ACTIVE_WINDOW = timedelta(minutes=int(os.getenv("DISPATCH_ACTIVE_MINUTES", 10)))
+OFFICER_RELOAD_SECONDS = int(os.getenv("DISPATCH_RELOAD_SECONDS", 30))
+
+# (radius_km, officers to notify, seconds to wait for a claim)
+DISPATCH_STAGES = [
+    (5.0, 5, 30),
+    (15.0, 10, 45),
+    (50.0, 25, 60),
+]
+GEO_ROOM_WAIT_SECONDS = 120
+
+
+class OfficerLocationIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._positions: Dict[int, Tuple[float, float, datetime, str]] = {}
+        self._cells: Dict[str, Set[int]] = {}
+
+    def update(self, officer_id: int, latitude: float, longitude: float, updated_at: datetime):
+        cell = utils.geohash_encode(latitude, longitude, OFFICER_CELL_PRECISION)
+        with self._lock:
+            self._discard(officer_id)
+            self._positions[officer_id] = (latitude, longitude, updated_at, cell)
+            self._cells.setdefault(cell, set()).add(officer_id)
+
+    def remove(self, officer_id: int):
+        with self._lock:
+            self._discard(officer_id)
+
+    def replace_all(self, officers: List[Tuple[int, float, float, datetime]]):
+        fresh = OfficerLocationIndex()
+        for officer in officers:
+            fresh.update(*officer)
+        with self._lock:
+            self._positions, self._cells = fresh._positions, fresh._cells
+
+    def nearest(self, latitude: float, longitude: float, k: int, radius_km: float,
+                exclude: Set[int] = frozenset()) -> List[Tuple[int, float]]:
+        """Up to k recently active officers within radius_km, nearest first, as (officer_id, distance_km)"""
+        cutoff = datetime.now(timezone.utc) - OFFICER_ACTIVE_WINDOW
+        prefixes = utils.geohash_cover(latitude, longitude, radius_km)
+        with self._lock:
+            candidates = []
+            for prefix in prefixes:
+                if len(prefix) >= OFFICER_CELL_PRECISION:
+                    cells = [prefix[:OFFICER_CELL_PRECISION]]
+                else:
+                    cells = [c for c in self._cells if c.startswith(prefix)]
+                for cell in cells:
+                    for officer_id in self._cells.get(cell, ()):
+                        lat, lon, updated_at, _ = self._positions[officer_id]
+                        if officer_id not in exclude and updated_at >= cutoff:
+                            candidates.append((officer_id, lat, lon))
+        candidates = list({c[0]: c for c in candidates}.values())
+        idx, distances = utils.nearest_k(
+            latitude, longitude, [c[1] for c in candidates], [c[2] for c in candidates], k, radius_km=radius_km
+        )
+        return [(candidates[i][0], d) for i, d in zip(idx.tolist(), distances.tolist())]
+
+    def position(self, officer_id: int) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            entry = self._positions.get(officer_id)
+            return (entry[0], entry[1]) if entry else None
+
+    def _discard(self, officer_id: int):
+        previous = self._positions.pop(officer_id, None)
+        if previous is not None:
+            bucket = self._cells.get(previous[3])
+            if bucket is not None:
+                bucket.discard(officer_id)
+                if not bucket:
+                    del self._cells[previous[3]]
+
+
+officer_locations = OfficerLocationIndex()
+
+
+def is_dispatchable(user: models.User) -> bool:
+    return (user.user_type == 'police' and user.approval_status == 'approved'
+            and user.account_status == 'active')
+
+
+def officer_location_changed(user: models.User):
+    """Call after an officer's location or dispatch eligibility changed"""
+    fix = location_buffer.latest(user.id) or (user.last_latitude, user.last_longitude, user.last_location_update)
+    latitude, longitude, updated_at = fix
+    if is_dispatchable(user) and latitude is not None and longitude is not None:
+        officer_locations.update(user.id, latitude, longitude, updated_at or datetime.now(timezone.utc))
+    else:
+        officer_locations.remove(user.id)
+
+
+def reload_officers():
+    db = SessionLocal()
+    try:
+        cutoff = datetime.now(timezone.utc) - OFFICER_ACTIVE_WINDOW
+        rows = db.query(
+            models.User.id, models.User.last_latitude, models.User.last_longitude, models.User.last_location_update
+        ).filter(
+            models.User.user_type == 'police',
+            models.User.approval_status == 'approved',
+            models.User.account_status == 'active',
+            models.User.last_latitude.isnot(None),
+            models.User.last_longitude.isnot(None),
+            models.User.last_location_update >= cutoff
+        ).all()
+        officers = []
+        for officer_id, latitude, longitude, updated_at in rows:
+            # Fixes still waiting in this worker's write-behind buffer are fresher
+            fix = location_buffer.latest(officer_id)
+            officers.append((officer_id, *fix) if fix else (officer_id, latitude, longitude, updated_at))
+        officer_locations.replace_all(officers)
+    finally:
+        db.close()
+
+
+def _reload_loop():
+    while True:
+        try:
+            reload_officers()
+        except Exception as e:
+            logger.error(f"Officer location reload failed: {e}")
+        time.sleep(OFFICER_RELOAD_SECONDS)
+
+
+def start_officer_index():
+    thread = threading.Thread(target=_reload_loop, daemon=True)
+    thread.start()
+
+
+def dispatchable_officer_ids(officer_ids: Set[int]) -> Set[int]:
+    db = SessionLocal()
+    try:
+        rows = db.query(models.User.id).filter(
+            models.User.id.in_(officer_ids),
+            models.User.user_type == 'police',
+            models.User.approval_status == 'approved',
+            models.User.account_status == 'active'
+        ).all()
+        return {officer_id for officer_id, in rows}
+    finally:
+        db.close()
+
+
+async def drop_ineligible_officers():
+    """Disconnect this worker's officer sockets whose account was suspended, rejected or deleted since they connected"""
+    officer_ids = local_officer_ids()
+    if not officer_ids:
+        return
+    eligible = await asyncio.to_thread(dispatchable_officer_ids, officer_ids)
+    for officer_id in officer_ids - eligible:
+        officer_locations.remove(officer_id)
+        await disconnect_officer(officer_id)
+
+
+async def geo_room_sync_loop():
+    """
+    Re-place this worker's officer sockets from the officer index. PUT /location
+    only moves sockets on the worker that served it; with several workers, the
+    others catch up here from the periodically reloaded positions. Sockets of
+    officers who may no longer receive alerts are dropped first: admin routes
+    run on one worker, and sessions are only authorised at connect.
+    """
+    while True:
+        await asyncio.sleep(OFFICER_RELOAD_SECONDS)
+        try:
+            await drop_ineligible_officers()
+            for officer_id in local_officer_ids():
+                position = officer_locations.position(officer_id)
+                if position:
+                    await place_officer(officer_id, *position)
+        except Exception as e:
+            logger.error(f"Geo room sync failed: {e}")
+
+
+async def _is_unclaimed(alert_id: int) -> bool:
+    if pending_alerts.ready:
+        return pending_alerts.is_pending(alert_id)
+    # Index still loading: ask the database without blocking the event loop
+    return await asyncio.to_thread(_is_pending_in_db, alert_id)
+
+
+def _is_pending_in_db(alert_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        alert = db.query(models.Alert.status).filter(models.Alert.id == alert_id).first()
+        return alert is not None and alert.status == 'pending'
+    finally:
+        db.close()
+
+
+async def dispatch_alert(alert_data: dict, latitude: Optional[float], longitude: Optional[float]):
+    """Notify officers in widening stages until the alert is claimed"""
+    try:
+        if latitude is not None and longitude is not None:
+            notified: Set[int] = set()
+            for radius_km, k, wait_seconds in DISPATCH_STAGES:
+                officers = officer_locations.nearest(latitude, longitude, k, radius_km, exclude=notified)
+                for officer_id, distance_km in officers:
+                    await sio.emit('new_alert', {**alert_data, "distance_km": round(distance_km, 2)},
+                                   room=f"user_{officer_id}")
+                    notified.add(officer_id)
+                if officers:
+                    logger.info(f"Alert {alert_data['id']}: notified {len(officers)} officers within {radius_km}km")
+                    await asyncio.sleep(wait_seconds)
+                if not await _is_unclaimed(alert_data["id"]):
+                    return
+            await sio.emit('new_alert', alert_data, room=geo_room_for(latitude, longitude))
+            await asyncio.sleep(GEO_ROOM_WAIT_SECONDS)
+            if not await _is_unclaimed(alert_data["id"]):
+                return
+        await sio.emit('new_alert', alert_data, room='police_all')
+    except Exception as e:
+        logger.error(f"Dispatch failed for alert {alert_data.get('id')}: {e}")
+        await sio.emit('new_alert', alert_data, room='police_all')
+
+
+# Running dispatch tasks (the event loop only keeps weak references)
+_dispatch_tasks: Set[asyncio.Task] = set()
+
+
+def start_dispatch(alert_data: dict, latitude: Optional[float], longitude: Optional[float]):
+    task = asyncio.get_running_loop().create_task(dispatch_alert(alert_data, latitude, longitude))
+    _dispatch_tasks.add(task)
+    task.add_done_callback(_dispatch_tasks.discard)
@@ -0,0 +1,105 @@
+"""
+Write-behind buffer for user location pings.
+
+PUT /location only records the latest fix per user in memory; a background
+thread flushes the buffer every LOCATION_FLUSH_SECONDS with one bulk
+UPDATE ... FROM (VALUES ...) per chunk instead of one COMMIT per ping.
+Readers that need the freshest position use latest(), which falls back to
+the users.last_* columns once a fix has been flushed.
+"""
+
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from sqlalchemy import text
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+LOCATION_FLUSH_SECONDS = float(os.getenv("LOCATION_FLUSH_SECONDS", 2))
+FLUSH_CHUNK_SIZE = 500
+
+Fix = Tuple[float, float, datetime]
+
+
+class LocationBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Fix] = {}
+        self._latest: Dict[int, Fix] = {}
+
+    def record(self, user_id: int, latitude: float, longitude: float, timestamp: datetime):
+        fix = (latitude, longitude, timestamp)
+        with self._lock:
+            current = self._latest.get(user_id)
+            if current is not None and current[2] > timestamp:
+                return
+            self._pending[user_id] = fix
+            self._latest[user_id] = fix
+
+    def latest(self, user_id: int) -> Optional[Fix]:
+        with self._lock:
+            return self._latest.get(user_id)
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        items = list(batch.items())
+        db = SessionLocal()
+        try:
+            for start in range(0, len(items), FLUSH_CHUNK_SIZE):
+                _bulk_update(db, items[start:start + FLUSH_CHUNK_SIZE])
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the fixes back unless a newer one arrived meanwhile
+            with self._lock:
+                for user_id, fix in items:
+                    self._pending.setdefault(user_id, fix)
+            raise
+        finally:
+            db.close()
+        with self._lock:
+            # Flushed fixes are now in users.last_*; keep only ones still unflushed
+            for user_id, fix in items:
+                if self._latest.get(user_id) == fix and user_id not in self._pending:
+                    del self._latest[user_id]
+        return len(items)
+
+
+def _bulk_update(db, items):
+    rows, params = [], {}
+    for i, (user_id, (latitude, longitude, timestamp)) in enumerate(items):
+        rows.append(
+            f"(CAST(:id{i} AS integer), CAST(:lat{i} AS double precision), "
+            f"CAST(:lon{i} AS double precision), CAST(:ts{i} AS timestamptz))"
+        )
+        params.update({f"id{i}": user_id, f"lat{i}": latitude, f"lon{i}": longitude, f"ts{i}": timestamp})
+    db.execute(text(
+        "UPDATE users SET last_latitude = v.lat, last_longitude = v.lon, last_location_update = v.ts "
+        f"FROM (VALUES {', '.join(rows)}) AS v(id, lat, lon, ts) "
+        # Another worker may already have written a newer fix
+        "WHERE users.id = v.id AND (users.last_location_update IS NULL OR users.last_location_update < v.ts)"
+    ), params)
+
+
+location_buffer = LocationBuffer()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(LOCATION_FLUSH_SECONDS)
+        try:
+            location_buffer.flush()
+        except Exception as e:
+            logger.error(f"Location flush failed: {e}")
+
+
+def start_flusher():
+    thread = threading.Thread(target=_flush_loop, daemon=True)
+    thread.start()
@@ -0,0 +1,89 @@
+"""
+Location updates over the existing Socket.IO connection.
+
+Clients emit `location` with {latitude, longitude} and, during a Safe Walk,
+`safewalk_session_id`. The socket was authenticated at connect time, so no
+per-ping JWT decode or user lookup is needed (officers whose account changes
+afterwards are disconnected by dispatch.drop_ineligible_officers). Pings are throttled per socket:
+anything sooner than LOCATION_MIN_INTERVAL_SECONDS after the last accepted
+ping, or closer than LOCATION_MIN_DISTANCE_M to it, is dropped unless
+LOCATION_HEARTBEAT_SECONDS have passed. Accepted pings go through the same
+storage path as PUT /location and POST /safewalk/{id}/checkin.
+"""
+
+import os
+import asyncio
+import time
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from . import utils, dispatch
+from .database import SessionLocal
+from .location_buffer import location_buffer
+from .routers.safewalk import record_checkin
+from .socket_manager import sio, place_officer
+
+LOCATION_MIN_INTERVAL_SECONDS = float(os.getenv("LOCATION_MIN_INTERVAL_SECONDS", 2))
+LOCATION_MIN_DISTANCE_M = float(os.getenv("LOCATION_MIN_DISTANCE_M", 10))
+LOCATION_HEARTBEAT_SECONDS = float(os.getenv("LOCATION_HEARTBEAT_SECONDS", 60))
+
+
+async def record_location(user_id: int, dispatchable: bool, latitude: float, longitude: float):
+    """Store a user's position; officers are also moved in the dispatch index and geo rooms"""
+    now = datetime.now(timezone.utc)
+    location_buffer.record(user_id, latitude, longitude, now)
+    if dispatchable:
+        dispatch.officer_locations.update(user_id, latitude, longitude, now)
+        await place_officer(user_id, latitude, longitude)
+
+
+def _store_checkin(session_id: int, user_id: int, latitude: float, longitude: float):
+    db = SessionLocal()
+    try:
+        record_checkin(db, session_id, user_id, latitude, longitude)
+    finally:
+        db.close()
+
+
+def _should_accept(session: dict, latitude: float, longitude: float) -> bool:
+    now = time.monotonic()
+    last = session.get("last_location")
+    if last is not None:
+        elapsed = now - last[2]
+        if elapsed < LOCATION_HEARTBEAT_SECONDS:
+            if elapsed < LOCATION_MIN_INTERVAL_SECONDS:
+                return False
+            if utils.calculate_distance_km(last[0], last[1], latitude, longitude) * 1000 < LOCATION_MIN_DISTANCE_M:
+                return False
+    session["last_location"] = (latitude, longitude, now)
+    return True
+
+
+@sio.on('location')
+async def location(sid, data):
+    session = await sio.get_session(sid)
+    if not session.get("user_id") or not session.get("approved"):
+        return {"ok": False, "error": "Not authenticated"}
+    try:
+        latitude, longitude = float(data["latitude"]), float(data["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return {"ok": False, "error": "latitude and longitude are required"}
+    safewalk_session_id = data.get("safewalk_session_id")
+    if safewalk_session_id:
+        try:
+            safewalk_session_id = int(safewalk_session_id)
+        except (TypeError, ValueError):
+            return {"ok": False, "error": "safewalk_session_id must be an integer"}
+
+    if not _should_accept(session, latitude, longitude):
+        return {"ok": True, "accepted": False}
+    await sio.save_session(sid, session)
+
+    await record_location(session["user_id"], session["user_type"] == 'police', latitude, longitude)
+
+    if safewalk_session_id:
+        try:
+            # Blocking DB work; keep it off the event loop
+            await asyncio.to_thread(_store_checkin, safewalk_session_id, session["user_id"], latitude, longitude)
+        except HTTPException as e:
+            return {"ok": False, "error": e.detail}
+    return {"ok": True, "accepted": True}
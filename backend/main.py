@@ -1,11 +1,14 @@
+import asyncio
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
+from sqlalchemy import text
 from dotenv import load_dotenv
-from . import models, database
+from . import models, database, migrate
 from .routers import auth, users, alerts, chat, admin, safewalk
-from . import safewalk_monitor
+from . import safewalk_monitor, alert_index, alert_service, dispatch, location_buffer, transcription_queue, transcription_service
+from . import location_stream  # registers the 'location' socket event
 from .socket_manager import sio
 import socketio
 
@@ -13,6 +16,19 @@ load_dotenv()
 
 models.Base.metadata.create_all(bind=database.engine)
 
+# create_all only creates missing tables, so columns/indexes added to existing
+# tables after the first deploy are applied here (idempotent)
+SCHEMA_UPGRADES = [
+    "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS geo_cell VARCHAR(12)",
+    "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS safe_walk_session_id INTEGER REFERENCES safe_walk_sessions (id) ON DELETE SET NULL",
+    *migrate.SEARCH_TRIGGER_SQL,
+]
+# Index builds and backfills on existing tables are not run here, at import
+# time in every worker, but once per deploy: python -m backend.migrate
+with database.engine.begin() as conn:
+    for statement in SCHEMA_UPGRADES:
+        conn.execute(text(statement))
+
 fastapi_app = FastAPI(title="SOS App API", version="4.0")
 
 # CORS middleware
@@ -22,6 +38,7 @@ fastapi_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include Routers
@@ -40,6 +57,10 @@ app = socketio.ASGIApp(sio, fastapi_app)
 @fastapi_app.on_event("startup")
 def startup_event():
     safewalk_monitor.start_monitor()
+    alert_index.start_index()
+    location_buffer.start_flusher()
+    dispatch.start_officer_index()
+    transcription_queue.start_workers()
     
     # --- AUTO-CREATE DEFAULT ADMIN ---
     try:
@@ -74,6 +95,20 @@ def startup_event():
         print(f"Error creating default admin: {e}")
     # ---------------------------------
 
+@fastapi_app.on_event("shutdown")
+def shutdown_event():
+    # Don't lose buffered location fixes on a clean restart
+    try:
+        location_buffer.location_buffer.flush()
+    except Exception as e:
+        print(f"Error flushing buffered locations: {e}")
+    transcription_service.stop_pool()
+
+@fastapi_app.on_event("startup")
+async def start_async_workers():
+    alert_service.bind_loop(asyncio.get_running_loop())
+    asyncio.get_running_loop().create_task(dispatch.geo_room_sync_loop())
+
 @fastapi_app.get("/")
 def read_root():
     return {"message": "SOSApp Backend is running", "version": "4.0"}
@@ -0,0 +1,131 @@
+"""
+One-off migrations too heavy to run at startup.
+
+create_all and main.SCHEMA_UPGRADES run at import time in every worker, so
+they only make cheap changes: new tables, nullable columns, triggers.
+Anything that scans or rewrites a large table runs here instead, once per
+deploy, from the repository root (safe to re-run; an interrupted run
+resumes where it stopped):
+
+    python -m backend.migrate
+
+Backfills go in short batches by primary key, each in its own transaction,
+and indexes are built with CREATE INDEX CONCURRENTLY, so alert writes never
+wait behind the migration.
+"""
+
+import time
+from sqlalchemy import text
+from . import models, utils
+from .database import engine
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Indexes on tables that may already be large; fresh databases get them from create_all
+INDEXES = {
+    "ix_alerts_status_geo_cell": "ON alerts (status, geo_cell)",
+    "ix_alerts_search_vector": "ON alerts USING GIN (search_vector)",
+    "ix_alerts_created_at_id": "ON alerts (created_at, id)",
+    "ix_alert_responses_officer_time_id": "ON alert_responses (officer_id, response_time, id)",
+    "ix_safe_walk_sessions_active_end_time": "ON safe_walk_sessions (end_time) WHERE status = 'active'",
+}
+
+
+def search_vector_sql(row: str = "") -> str:
+    """The tsvector expression over an alert's text columns, optionally qualified (e.g. 'NEW.')"""
+    columns = " || ' ' || ".join(f"coalesce({row}{column}, '')" for column in models.ALERT_SEARCH_COLUMNS)
+    return f"to_tsvector('{models.ALERT_SEARCH_CONFIG}', {columns})"
+
+
+# Keeps alerts.search_vector current on every insert and text update; cheap
+# and idempotent, so main.SCHEMA_UPGRADES runs it at startup
+SEARCH_TRIGGER_SQL = [
+    "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""
+    CREATE OR REPLACE FUNCTION alerts_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {search_vector_sql('NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'alerts_search_vector_update') THEN
+            CREATE TRIGGER alerts_search_vector_update
+            BEFORE INSERT OR UPDATE OF {', '.join(models.ALERT_SEARCH_COLUMNS)} ON alerts
+            FOR EACH ROW EXECUTE FUNCTION alerts_search_vector_update();
+        END IF;
+    END
+    $$
+    """,
+]
+
+
+def backfill(table: str, assignment: str, condition: str, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Run UPDATE table SET assignment WHERE condition over the whole table, one id range per transaction"""
+    last_id, updated = 0, 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(
+                text(f"SELECT id FROM {table} WHERE id > :last ORDER BY id LIMIT :n"),
+                {"last": last_id, "n": batch_size}
+            ).scalars().all()
+            if not ids:
+                return updated
+            updated += conn.execute(
+                text(f"UPDATE {table} SET {assignment} WHERE id BETWEEN :first AND :last AND ({condition})"),
+                {"first": ids[0], "last": ids[-1]}
+            ).rowcount
+        last_id = ids[-1]
+
+
+def backfill_geo_cells(batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Geohash cells for located alerts created before the column existed (computed in Python)"""
+    last_id, updated = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, latitude, longitude FROM alerts WHERE id > :last AND geo_cell IS NULL "
+                "AND latitude IS NOT NULL AND longitude IS NOT NULL ORDER BY id LIMIT :n"
+            ), {"last": last_id, "n": batch_size}).all()
+            if not rows:
+                return updated
+            conn.execute(
+                text("UPDATE alerts SET geo_cell = :cell WHERE id = :id"),
+                [{"id": row.id, "cell": utils.geo_cell_for(row.latitude, row.longitude)} for row in rows]
+            )
+            updated += len(rows)
+        last_id = rows[-1].id
+
+
+def build_indexes():
+    # CONCURRENTLY cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, definition in INDEXES.items():
+            # A failed concurrent build leaves an invalid index that IF NOT EXISTS would skip
+            invalid = conn.execute(text(
+                "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {"name": name}).first()
+            if invalid:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            started = time.monotonic()
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}"))
+            print(f"Index {name} ready ({time.monotonic() - started:.1f}s)")
+
+
+def migrate():
+    started = time.monotonic()
+    filled = backfill_geo_cells()
+    print(f"Geo cells backfilled for {filled} alerts ({time.monotonic() - started:.1f}s)")
+    started = time.monotonic()
+    # Alerts written before the search trigger existed
+    filled = backfill("alerts", f"search_vector = {search_vector_sql()}", "search_vector IS NULL")
+    print(f"Search text backfilled for {filled} alerts ({time.monotonic() - started:.1f}s)")
+    build_indexes()
+
+
+if __name__ == "__main__":
+    migrate()
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Date, Boolean, Float
-from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Date, Boolean, Float, Index
+from sqlalchemy.sql import func, text, literal
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from .database import Base
 
 class User(Base):
@@ -79,6 +80,9 @@ class Alert(Base):
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
     
+    # Geohash cell of the location (utils.GEOHASH_PRECISION chars), used for radius lookups
+    geo_cell = Column(String(12), nullable=True)
+    
     # Alert tag: 'police', 'fire', 'ambulance', 'wildlife', 'other'
     tag = Column(String(50), nullable=True)
     
@@ -90,6 +94,12 @@ class Alert(Base):
     transcription_keywords = Column(Text, nullable=True)  # Comma-separated keywords
     transcription_status = Column(String(20), default='none')  # 'none', 'pending', 'completed', 'failed'
     
+    # Full-text search vector, maintained by a trigger; never loaded with the alert
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True))
+    
+    # Safe Walk session that raised this alert (panic button or expiry)
+    safe_walk_session_id = Column(Integer, ForeignKey("safe_walk_sessions.id", ondelete="SET NULL"), nullable=True)
+    
     # Responding officer
     responded_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     responded_at = Column(DateTime(timezone=True), nullable=True)
@@ -106,6 +116,27 @@ class Alert(Base):
     # Relationship to chat messages
     messages = relationship("ChatMessage", back_populates="alert")
 
+    __table_args__ = (
+        # Nearby feed reads pending alerts by geohash range within candidate cells
+        Index("ix_alerts_status_geo_cell", "status", "geo_cell"),
+        # Search results are paged newest first
+        Index("ix_alerts_created_at_id", "created_at", "id"),
+        Index("ix_alerts_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+# Full-text search over alert text: alerts.search_vector is kept current by a
+# trigger (migrate.SEARCH_TRIGGER_SQL, installed at startup) whenever content,
+# transcription or keywords are written
+ALERT_SEARCH_CONFIG = "english"
+ALERT_SEARCH_COLUMNS = ("content", "transcription", "transcription_keywords")
+
+
+def alert_text_matches(query: str):
+    """Filter for alerts matching a web-search style query (phrases in quotes, OR, -word)"""
+    return Alert.search_vector.op("@@")(
+        func.websearch_to_tsquery(literal(ALERT_SEARCH_CONFIG, type_=REGCONFIG), query)
+    )
+
 class AlertResponse(Base):
     """Tracks police officer responses to alerts"""
     __tablename__ = "alert_responses"
@@ -131,6 +162,11 @@ class AlertResponse(Base):
     alert = relationship("Alert", back_populates="responses")
     officer = relationship("User", back_populates="responses", foreign_keys=[officer_id])
 
+    __table_args__ = (
+        # Officer history is read newest first with keyset pagination
+        Index("ix_alert_responses_officer_time_id", "officer_id", "response_time", "id"),
+    )
+
 class ChatMessage(Base):
     """Chat messages between citizens and officers for an alert"""
     __tablename__ = "chat_messages"
@@ -171,11 +207,73 @@ class SafeWalkSession(Base):
     
     # Relationship
     user = relationship("User", back_populates="safe_walk_sessions")
+    points = relationship("SafeWalkPoint", back_populates="session", passive_deletes=True)
+
+    __table_args__ = (
+        # Expiry claims scan only active sessions, ordered by deadline
+        Index("ix_safe_walk_sessions_active_end_time", "end_time",
+              postgresql_where=text("status = 'active'"), sqlite_where=text("status = 'active'")),
+    )
+
+class SafeWalkPoint(Base):
+    """Append-only breadcrumb trail of a Safe Walk session"""
+    __tablename__ = "safe_walk_points"
+    
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey("safe_walk_sessions.id", ondelete="CASCADE"), nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    recorded_at = Column(DateTime(timezone=True), nullable=False)
+    
+    session = relationship("SafeWalkSession", back_populates="points")
+
+    __table_args__ = (
+        # Trails are always read per session in time order
+        Index("ix_safe_walk_points_session_time", "session_id", "recorded_at"),
+    )
 
 # Update User model to include the relationship
 # This is handled dynamically by SQLAlchemy usually, but good to be explicit if we edited User
 
 
+class TranscriptionJob(Base):
+    """Durable queue entry for transcribing a voice alert"""
+    __tablename__ = "transcription_jobs"
+    
+    id = Column(Integer, primary_key=True)
+    alert_id = Column(Integer, ForeignKey("alerts.id", ondelete="CASCADE"), nullable=False, unique=True)
+    audio_path = Column(String(500), nullable=False)
+    
+    priority = Column(Integer, nullable=False, default=0)  # higher runs first
+    status = Column(String(20), nullable=False, default='queued')  # 'queued', 'running', 'completed', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # retry backoff
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    leased_until = Column(DateTime(timezone=True), nullable=True)  # a running job past this is requeued
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Workers claim the highest-priority ready job
+        Index("ix_transcription_jobs_queued", "priority", "available_at",
+              postgresql_where=text("status = 'queued'"), sqlite_where=text("status = 'queued'")),
+    )
+
+
+class TranscriptionCacheEntry(Base):
+    """Transcription results keyed by the SHA-256 of the audio bytes and the model that transcribed them"""
+    __tablename__ = "transcription_cache"
+    
+    audio_sha256 = Column(String(64), primary_key=True)
+    transcription = Column(Text, nullable=False)
+    keywords = Column(Text, nullable=True)  # comma-separated, as on Alert
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+
 class OTPStore(Base):
     """Temporary storage for OTPs"""
     __tablename__ = "otp_store"
@@ -0,0 +1,96 @@
+"""
+Keyset (cursor) pagination shared by the list endpoints.
+
+Pages are ordered by a (timestamp, id) key. The cursor is an opaque token
+encoding the key of the last row on the page; the next page continues
+strictly after it, so every page is an index range read no matter how deep
+the client has scrolled. The cursor for the next page is returned in the
+X-Next-Cursor response header (absent on the last page), which keeps the
+list bodies unchanged for existing clients.
+
+The first part of the key may also be a number: the nearby feed is paged
+nearest first on a (distance, id) key.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple, Union
+from fastapi import HTTPException, Response
+from sqlalchemy import asc, desc, tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+Key = Tuple[Union[datetime, float], int]
+
+
+def encode_cursor(key: Key) -> str:
+    value, row_id = key
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else float(value), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Key:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(value) if isinstance(value, str) else float(value)), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def paginate_query(query, time_column, id_column, key: Callable[[Any], Key],
+                   cursor: Optional[str], limit: int, descending: bool = True):
+    """
+    Apply keyset filtering, ordering and limit to a SQLAlchemy query.
+
+    Args:
+        query: Query to page through
+        time_column, id_column: Columns forming the sort key
+        key: Returns the (timestamp, id) key of a result row
+        cursor: Cursor from the previous page, or None for the first page
+        limit: Page size
+        descending: Newest first when True
+
+    Returns:
+        (rows, next_cursor) where next_cursor is None on the last page
+    """
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        if not isinstance(value, datetime):
+            # A (distance, id) cursor from the nearby feed
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+        boundary = tuple_(value, row_id)
+        columns = tuple_(time_column, id_column)
+        query = query.filter(columns < boundary if descending else columns > boundary)
+    order = desc if descending else asc
+    rows = query.order_by(order(time_column), order(id_column)).limit(limit + 1).all()
+    return _split_page(rows, key, limit)
+
+
+def paginate_list(items: List[Any], key: Callable[[Any], Key], cursor: Optional[str],
+                  limit: int, descending: bool = True):
+    """Same contract as paginate_query for rows already held in memory"""
+    items = sorted(items, key=key, reverse=descending)
+    if cursor:
+        boundary = decode_cursor(cursor)
+        try:
+            items = [item for item in items if (key(item) < boundary if descending else key(item) > boundary)]
+        except TypeError:
+            # A cursor issued by a list with a different kind of key
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return _split_page(items[:limit + 1], key, limit)
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+def _split_page(rows, key, limit):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(key(rows[-1]))
+    return rows, None
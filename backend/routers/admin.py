@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from datetime import datetime, timezone
-from typing import List
-from .. import models, schemas, database, utils
+from typing import List, Optional
+from .. import models, schemas, database, utils, pagination, dispatch, transcription_queue
 
 router = APIRouter(tags=["Admin"])
 
@@ -15,16 +15,36 @@ def get_pending_officers(current_user: models.User = Depends(utils.get_admin_use
     ).order_by(desc(models.User.created_at)).all()
 
 @router.get("/admin/all-officers", response_model=List[schemas.AdminUserItem])
-def get_all_officers(current_user: models.User = Depends(utils.get_admin_user), db: Session = Depends(database.get_db)):
-    return db.query(models.User).filter(
-        models.User.user_type == 'police'
-    ).order_by(desc(models.User.created_at)).all()
+def get_all_officers(
+    response: Response,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    current_user: models.User = Depends(utils.get_admin_user),
+    db: Session = Depends(database.get_db)
+):
+    query = db.query(models.User).filter(models.User.user_type == 'police')
+    users, next_cursor = pagination.paginate_query(
+        query, models.User.created_at, models.User.id,
+        key=lambda user: (user.created_at, user.id), cursor=cursor, limit=limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return users
 
 @router.get("/admin/all-citizens", response_model=List[schemas.AdminUserItem])
-def get_all_citizens(current_user: models.User = Depends(utils.get_admin_user), db: Session = Depends(database.get_db)):
-    return db.query(models.User).filter(
-        models.User.user_type == 'citizen'
-    ).order_by(desc(models.User.created_at)).all()
+def get_all_citizens(
+    response: Response,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    current_user: models.User = Depends(utils.get_admin_user),
+    db: Session = Depends(database.get_db)
+):
+    query = db.query(models.User).filter(models.User.user_type == 'citizen')
+    users, next_cursor = pagination.paginate_query(
+        query, models.User.created_at, models.User.id,
+        key=lambda user: (user.created_at, user.id), cursor=cursor, limit=limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return users
 
 @router.get("/admin/user/{user_id}", response_model=schemas.AdminUserItem)
 def get_user_details(user_id: int, current_user: models.User = Depends(utils.get_admin_user), db: Session = Depends(database.get_db)):
@@ -43,6 +63,7 @@ def approve_officer(user_id: int, approval: schemas.AdminApproval = None, curren
     
     user.approval_status = 'approved'
     db.commit()
+    dispatch.officer_location_changed(user)
     return {"message": "Officer approved successfully", "user_id": user_id}
 
 @router.post("/admin/reject/{user_id}")
@@ -55,6 +76,7 @@ def reject_officer(user_id: int, rejection: schemas.AdminApproval = None, curren
     
     user.approval_status = 'rejected'
     db.commit()
+    dispatch.officer_location_changed(user)
     return {"message": "Officer rejected", "user_id": user_id}
 
 @router.post("/admin/suspend/{user_id}")
@@ -70,6 +92,7 @@ def suspend_user(user_id: int, suspension: schemas.AdminSuspension, current_user
     user.suspended_at = datetime.now(timezone.utc)
     user.suspended_by = current_user.id
     db.commit()
+    dispatch.officer_location_changed(user)
     
     return {"message": f"User {user.cnic} suspended", "reason": suspension.reason}
 
@@ -84,6 +107,7 @@ def unsuspend_user(user_id: int, current_user: models.User = Depends(utils.get_a
     user.suspended_at = None
     user.suspended_by = None
     db.commit()
+    dispatch.officer_location_changed(user)
     
     return {"message": f"User {user.cnic} reactivated"}
 
@@ -97,5 +121,10 @@ def delete_user(user_id: int, current_user: models.User = Depends(utils.get_admi
     
     user.account_status = 'deleted'
     db.commit()
+    dispatch.officer_location_changed(user)
     
     return {"message": f"User {user.cnic} deleted"}
+
+@router.get("/admin/transcription-queue", response_model=schemas.TranscriptionQueueStats)
+def get_transcription_queue(current_user: models.User = Depends(utils.get_admin_user), db: Session = Depends(database.get_db)):
+    return transcription_queue.queue_stats(db)
@@ -1,21 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, BackgroundTasks, Response
 from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import exists
 from datetime import datetime, timezone
-from pathlib import Path
-from typing import List
+from typing import List, Optional
+import math
 import shutil
 import uuid
-from .. import models, schemas, database, utils
-from ..transcription_service import start_transcription
+import numpy as np
+from .. import models, schemas, database, utils, pagination, alert_index, alert_service, transcription_queue
+from ..alert_index import pending_alerts, SENDER_PROJECTION
+from ..transcription_service import AUDIO_UPLOAD_DIR, audio_path_for
 from ..socket_manager import sio
 
 router = APIRouter(tags=["Alerts"])
 
-AUDIO_UPLOAD_DIR = Path("uploads/audio")
 AUDIO_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+# Nearby feed search window
+NEARBY_DEFAULT_RADIUS_KM = 50.0
+NEARBY_MAX_RADIUS_KM = 500.0
+NEARBY_DEFAULT_LIMIT = 50
+NEARBY_MAX_LIMIT = 200
+
+SEARCH_MAX_QUERY_LENGTH = 200
 
 
 @router.post("/alerts", response_model=schemas.AlertOut, status_code=status.HTTP_201_CREATED)
@@ -25,129 +33,180 @@ async def create_alert(
     current_user: models.User = Depends(utils.get_approved_user), 
     db: Session = Depends(database.get_db)
 ):
-    # Determine transcription status for voice alerts
-    transcription_status = 'pending' if alert.alert_type == 'voice' and alert.audio_url else 'none'
-    
-    new_alert = models.Alert(
-        user_id=current_user.id,
-        alert_type=alert.alert_type,
-        content=alert.content,
-        audio_url=alert.audio_url,
-        latitude=alert.latitude,
-        longitude=alert.longitude,
-        tag=alert.tag,
-        status='pending',
-        transcription_status=transcription_status
+    new_alert = alert_service.build_alert(
+        current_user.id, alert.alert_type, alert.latitude, alert.longitude,
+        content=alert.content, audio_url=alert.audio_url, tag=alert.tag
     )
     db.add(new_alert)
+    if new_alert.transcription_status == 'pending':
+        # Queued in the same transaction, so a crash cannot lose the job
+        transcription_queue.transcribe_or_enqueue(db, new_alert, audio_path_for(alert.audio_url))
     db.commit()
     db.refresh(new_alert)
+    transcription_queue.wake()
     
-    # Start background transcription for voice alerts
-    if alert.alert_type == 'voice' and alert.audio_url:
-        # Construct full path to audio file
-        audio_path = str(AUDIO_UPLOAD_DIR / alert.audio_url.replace('/audio/', ''))
-        # Using FastAPI BackgroundTasks instead of raw thread (though implementation of start_transcription uses thread)
-        # We can wrap it here or rely on the service. The service uses threading.Thread which is async enough.
-        # But let's pass it to BackgroundTasks for better practice if we refactor service.
-        # For now, start_transcription expects db_session_factory
-        start_transcription(new_alert.id, audio_path, database.SessionLocal)
-    
-    # Emit WebSockets
-    alert_data = schemas.AlertOut.from_orm(new_alert).dict()
-    for k, v in alert_data.items():
-        if isinstance(v, datetime): alert_data[k] = v.isoformat()
-    
-    await sio.emit('new_alert', alert_data, room='police_all')
+    # Index it and dispatch to the nearest officers first, widening until someone responds
+    alert_service.publish(new_alert, sender=current_user)
     
     return new_alert
 
 @router.get("/alerts", response_model=List[schemas.AlertOut])
-def get_alerts(current_user: models.User = Depends(utils.get_approved_user), db: Session = Depends(database.get_db)):
-    alerts = db.query(models.Alert).filter(models.Alert.user_id == current_user.id).order_by(desc(models.Alert.created_at)).all()
+def get_alerts(
+    response: Response,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    current_user: models.User = Depends(utils.get_approved_user),
+    db: Session = Depends(database.get_db)
+):
+    # One round trip: chat presence via EXISTS, responding officer via the relationship join
+    has_chat = exists().where(models.ChatMessage.alert_id == models.Alert.id).label("has_chat")
+    query = db.query(models.Alert, has_chat).options(
+        joinedload(models.Alert.responding_officer)
+    ).filter(models.Alert.user_id == current_user.id)
+    rows, next_cursor = pagination.paginate_query(
+        query, models.Alert.created_at, models.Alert.id,
+        key=lambda row: (row[0].created_at, row[0].id), cursor=cursor, limit=limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
     
     result = []
-    for alert in alerts:
-        # Check if there are chat messages
-        has_chat = db.query(models.ChatMessage).filter(models.ChatMessage.alert_id == alert.id).first() is not None
-        
+    for alert, alert_has_chat in rows:
         alert_dict = {
             "id": alert.id, "alert_type": alert.alert_type, "content": alert.content,
             "audio_url": alert.audio_url, "created_at": alert.created_at,
             "latitude": alert.latitude, "longitude": alert.longitude,
             "tag": alert.tag, "status": alert.status,
             "responded_by": alert.responded_by, "responded_at": alert.responded_at,
-            "responding_officer": None, "has_chat": has_chat,
+            "responding_officer": None, "has_chat": bool(alert_has_chat),
             "transcription": alert.transcription,
             "transcription_keywords": alert.transcription_keywords,
             "transcription_status": alert.transcription_status
         }
         
-        if alert.responded_by:
-            officer = db.query(models.User).filter(models.User.id == alert.responded_by).first()
-            if officer:
-                alert_dict["responding_officer"] = {
-                    "id": officer.id, "full_name": officer.full_name,
-                    "badge_number": officer.police_badge_number, "phone": officer.phone
-                }
+        officer = alert.responding_officer
+        if officer:
+            alert_dict["responding_officer"] = {
+                "id": officer.id, "full_name": officer.full_name,
+                "badge_number": officer.police_badge_number, "phone": officer.phone
+            }
         result.append(alert_dict)
     return result
 
 @router.get("/alerts/nearby", response_model=List[schemas.AlertForPolice])
 def get_nearby_alerts(
+    response: Response,
     latitude: float = Query(...),
     longitude: float = Query(...),
+    radius_km: float = Query(NEARBY_DEFAULT_RADIUS_KM, gt=0, le=NEARBY_MAX_RADIUS_KM),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(NEARBY_DEFAULT_LIMIT, ge=1, le=NEARBY_MAX_LIMIT),
     current_user: models.User = Depends(utils.get_police_user),
     db: Session = Depends(database.get_db)
 ):
-    # Get pending alerts
-    pending_alerts = db.query(models.Alert).filter(
-        models.Alert.status == 'pending',
-        models.Alert.latitude.isnot(None),
-        models.Alert.longitude.isnot(None)
-    ).all()
+    # Get pending alerts in the geohash cells around the officer: from the live
+    # in-memory index when it is in sync, otherwise from the indexed table
+    candidate_cells = utils.geohash_cover(latitude, longitude, radius_km)
+    if pending_alerts.ready:
+        candidates = pending_alerts.pending_in_cells(candidate_cells)
+    else:
+        candidates = [alert_index.snapshot(a) for a in db.query(models.Alert).options(SENDER_PROJECTION).filter(
+            models.Alert.status == 'pending',
+            utils.geohash_prefix_filter(models.Alert.geo_cell, candidate_cells)
+        )]
+    idx, in_radius_km = utils.within_radius(
+        latitude, longitude,
+        [a["latitude"] for a in candidates], [a["longitude"] for a in candidates],
+        radius_km
+    )
+    # Unlike the other lists this feed is paged nearest first on a (distance, id)
+    # key, so the closest alerts are always on the first page even in a surge.
+    # The cursor is relative to the officer's position in the request.
+    page, next_cursor = pagination.paginate_list(
+        [{**candidates[i], "distance_km": d} for i, d in zip(idx.tolist(), in_radius_km.tolist())],
+        key=lambda a: (a["distance_km"], a["id"]), cursor=cursor, limit=limit, descending=False
+    )
+    pagination.set_next_cursor(response, next_cursor)
 
-    # Get alerts responded to by THIS officer (active responses)
-    my_active_responses = db.query(models.Alert).filter(
-        models.Alert.status == 'responded',
-        models.Alert.responded_by == current_user.id
-    ).all()
-    
-    # Combine lists
-    all_relevant_alerts = pending_alerts + my_active_responses
-    
-    # Sort by creation time (descending)
-    all_relevant_alerts.sort(key=lambda x: x.created_at, reverse=True)
+    # Get alerts responded to by THIS officer (active responses), on the first page only
+    my_active_responses = []
+    if cursor is None:
+        if pending_alerts.ready:
+            my_active_responses = pending_alerts.responding(current_user.id)
+        else:
+            my_active_responses = [alert_index.snapshot(a) for a in db.query(models.Alert).options(SENDER_PROJECTION).filter(
+                models.Alert.status == 'responded',
+                models.Alert.responded_by == current_user.id
+            )]
     
-    result = []
-    for alert in all_relevant_alerts:
-        distance = utils.calculate_distance_km(latitude, longitude, alert.latitude, alert.longitude)
-        sender = db.query(models.User).filter(models.User.id == alert.user_id).first()
-        
-        result.append({
-            "id": alert.id, "alert_type": alert.alert_type, "content": alert.content,
-            "audio_url": alert.audio_url, "created_at": alert.created_at,
-            "latitude": alert.latitude, "longitude": alert.longitude,
-            "tag": alert.tag, "status": alert.status,
-            "distance_km": round(distance, 2),
-            "sender": {
-                "id": sender.id,
-                "full_name": sender.full_name,
-                "cnic_masked": utils.mask_cnic(sender.cnic),
-                "email": sender.email,
-                "phone": sender.phone,
-                "address": sender.address,
-                "gender": sender.gender
-            } if sender else None,
-            # Transcription fields
-            "transcription": alert.transcription,
-            "transcription_keywords": alert.transcription_keywords,
-            "transcription_status": alert.transcription_status or 'none'
-        })
+    # Distances for the active responses in one vectorized pass (NaN where an alert has no location)
+    distances = utils.haversine_many(
+        latitude, longitude,
+        [a["latitude"] if a["latitude"] is not None else np.nan for a in my_active_responses],
+        [a["longitude"] if a["longitude"] is not None else np.nan for a in my_active_responses]
+    )
     
-    result.sort(key=lambda x: x["distance_km"])
+    result = [{**alert, "distance_km": round(alert["distance_km"], 2)} for alert in page] + [
+        {**alert, "distance_km": round(distance, 2) if not math.isnan(distance) else None}
+        for alert, distance in zip(my_active_responses, distances.tolist())
+    ]
+    result.sort(key=lambda x: x["distance_km"] if x["distance_km"] is not None else float("inf"))
     return result
 
+@router.get("/alerts/search", response_model=List[schemas.AlertForPolice])
+def search_alerts(
+    response: Response,
+    q: Optional[str] = Query(None, min_length=1, max_length=SEARCH_MAX_QUERY_LENGTH),
+    tag: Optional[str] = Query(None),
+    alert_status: Optional[str] = Query(None, alias="status"),
+    created_after: Optional[datetime] = Query(None),
+    created_before: Optional[datetime] = Query(None),
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    current_user: models.User = Depends(utils.get_police_or_admin_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Search alerts by their text (content, transcription and keywords), newest first.
+
+    q takes web search syntax: "quoted phrases", OR, and -excluded words. The
+    filters narrow by tag, status, creation time and a latitude/longitude box.
+    """
+    query = db.query(models.Alert).options(SENDER_PROJECTION)
+    if q:
+        query = query.filter(models.alert_text_matches(q))
+    if tag:
+        query = query.filter(models.Alert.tag == tag.lower())
+    if alert_status:
+        query = query.filter(models.Alert.status == alert_status)
+    if created_after and created_before and created_after > created_before:
+        raise HTTPException(status_code=400, detail="created_after must be before created_before")
+    if created_after:
+        query = query.filter(models.Alert.created_at >= created_after)
+    if created_before:
+        query = query.filter(models.Alert.created_at < created_before)
+
+    bounds = (min_lat, max_lat, min_lon, max_lon)
+    if any(b is not None for b in bounds):
+        if any(b is None for b in bounds):
+            raise HTTPException(status_code=400, detail="Bounding box needs min_lat, max_lat, min_lon and max_lon")
+        if min_lat > max_lat or min_lon > max_lon:
+            raise HTTPException(status_code=400, detail="Bounding box minimums must not exceed maximums")
+        query = query.filter(
+            models.Alert.latitude.between(min_lat, max_lat),
+            models.Alert.longitude.between(min_lon, max_lon)
+        )
+
+    rows, next_cursor = pagination.paginate_query(
+        query, models.Alert.created_at, models.Alert.id,
+        key=lambda alert: (alert.created_at, alert.id), cursor=cursor, limit=limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return [alert_index.snapshot(alert) for alert in rows]
+
 @router.post("/alerts/{alert_id}/respond", response_model=schemas.AlertResponseOut)
 async def respond_to_alert(
     alert_id: int,
@@ -193,6 +252,7 @@ async def respond_to_alert(
     
     db.commit()
     db.refresh(alert_response)
+    alert_index.alert_changed(alert, sender=citizen)
     
     # Emit to User
     response_data = schemas.AlertResponseOut.from_orm(alert_response).dict()
@@ -224,38 +284,47 @@ def update_response_status(alert_id: int, status_update: schemas.AlertResponseUp
     response.status = status_update.status
     if status_update.notes: response.notes = status_update.notes
     
+    alert = None
     if status_update.status == 'resolved':
         alert = db.query(models.Alert).filter(models.Alert.id == alert_id).first()
         if alert: alert.status = 'resolved'
     
     db.commit()
+    if alert: alert_index.alert_changed(alert)
     return {"message": f"Status updated to {status_update.status}"}
 
 @router.get("/police/history", response_model=List[schemas.PoliceHistoryItem])
-def get_police_history(current_user: models.User = Depends(utils.get_police_user), db: Session = Depends(database.get_db)):
-    responses = db.query(models.AlertResponse).filter(
-        models.AlertResponse.officer_id == current_user.id
-    ).order_by(desc(models.AlertResponse.response_time)).all()
+def get_police_history(
+    response: Response,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    current_user: models.User = Depends(utils.get_police_user),
+    db: Session = Depends(database.get_db)
+):
+    # AlertResponse ⋈ Alert ⋈ User, projected straight onto PoliceHistoryItem columns
+    query = db.query(
+        models.AlertResponse.id, models.AlertResponse.alert_id,
+        models.AlertResponse.response_time, models.AlertResponse.status,
+        models.AlertResponse.distance_km,
+        models.Alert.alert_type,
+        models.Alert.tag.label("alert_tag"),
+        models.Alert.content.label("alert_content"),
+        models.User.full_name.label("citizen_name"),
+        models.User.phone.label("citizen_phone"),
+        models.Alert.latitude, models.Alert.longitude,
+        models.Alert.audio_url, models.Alert.transcription
+    ).outerjoin(
+        models.Alert, models.Alert.id == models.AlertResponse.alert_id
+    ).outerjoin(
+        models.User, models.User.id == models.Alert.user_id
+    ).filter(models.AlertResponse.officer_id == current_user.id)
     
-    result = []
-    for resp in responses:
-        alert = db.query(models.Alert).filter(models.Alert.id == resp.alert_id).first()
-        citizen = db.query(models.User).filter(models.User.id == alert.user_id).first() if alert else None
-        
-        result.append({
-            "id": resp.id, "alert_id": resp.alert_id, "response_time": resp.response_time,
-            "status": resp.status, "distance_km": resp.distance_km,
-            "alert_type": alert.alert_type if alert else None,
-            "alert_tag": alert.tag if alert else None,
-            "alert_content": alert.content if alert else None,
-            "citizen_name": citizen.full_name if citizen else None,
-            "citizen_phone": citizen.phone if citizen else None,
-            "latitude": alert.latitude if alert else None,
-            "longitude": alert.longitude if alert else None,
-            "audio_url": alert.audio_url if alert else None,
-            "transcription": alert.transcription if alert else None
-        })
-    return result
+    rows, next_cursor = pagination.paginate_query(
+        query, models.AlertResponse.response_time, models.AlertResponse.id,
+        key=lambda row: (row.response_time, row.id), cursor=cursor, limit=limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return [dict(row._mapping) for row in rows]
 
 @router.post("/upload-audio")
 async def upload_audio(audio_file: UploadFile = File(...), current_user: models.User = Depends(utils.get_current_user)):
@@ -1,14 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session, load_only
 from datetime import datetime, timezone
-from typing import List
-from .. import models, schemas, database, utils
+from typing import List, Optional
+from .. import models, schemas, database, utils, pagination
 from ..socket_manager import sio
 
 router = APIRouter(tags=["Chat"])
 
 @router.get("/chat/{alert_id}", response_model=List[schemas.ChatMessageOut])
-def get_chat_messages(alert_id: int, current_user: models.User = Depends(utils.get_approved_user), db: Session = Depends(database.get_db)):
+def get_chat_messages(
+    alert_id: int,
+    response: Response,
+    since_id: Optional[int] = Query(None, description="Only return messages with an id greater than this"),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    current_user: models.User = Depends(utils.get_approved_user),
+    db: Session = Depends(database.get_db)
+):
     alert = db.query(models.Alert).filter(models.Alert.id == alert_id).first()
     if not alert:
         raise HTTPException(status_code=404, detail="Alert not found")
@@ -17,13 +25,27 @@ def get_chat_messages(alert_id: int, current_user: models.User = Depends(utils.g
     if alert.user_id != current_user.id and alert.responded_by != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to view this chat")
     
-    messages = db.query(models.ChatMessage).filter(
-        models.ChatMessage.alert_id == alert_id
-    ).order_by(models.ChatMessage.created_at).all()
+    query = db.query(models.ChatMessage).filter(models.ChatMessage.alert_id == alert_id)
+    if since_id is not None:
+        query = query.filter(models.ChatMessage.id > since_id)
+    messages, next_cursor = pagination.paginate_query(
+        query, models.ChatMessage.created_at, models.ChatMessage.id,
+        key=lambda msg: (msg.created_at, msg.id), cursor=cursor, limit=limit, descending=False
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    
+    # Resolve senders once per request (at most the two participants)
+    senders = {current_user.id: current_user}
+    missing_ids = {msg.sender_id for msg in messages} - senders.keys()
+    if missing_ids:
+        for user in db.query(models.User).options(
+            load_only(models.User.id, models.User.full_name, models.User.user_type)
+        ).filter(models.User.id.in_(missing_ids)):
+            senders[user.id] = user
     
     result = []
     for msg in messages:
-        sender = db.query(models.User).filter(models.User.id == msg.sender_id).first()
+        sender = senders.get(msg.sender_id)
         result.append({
             "id": msg.id, "alert_id": msg.alert_id,
             "sender_id": msg.sender_id, "receiver_id": msg.receiver_id,
@@ -34,13 +56,13 @@ def get_chat_messages(alert_id: int, current_user: models.User = Depends(utils.g
             "sender_type": sender.user_type if sender else None
         })
     
-    # Mark messages as read
-    db.query(models.ChatMessage).filter(
-        models.ChatMessage.alert_id == alert_id,
-        models.ChatMessage.receiver_id == current_user.id,
-        models.ChatMessage.read_at.is_(None)
-    ).update({"read_at": datetime.now(timezone.utc)})
-    db.commit()
+    # Mark the returned unread messages as read (no write when there is nothing new)
+    unread_ids = [msg.id for msg in messages if msg.receiver_id == current_user.id and msg.read_at is None]
+    if unread_ids:
+        db.query(models.ChatMessage).filter(
+            models.ChatMessage.id.in_(unread_ids)
+        ).update({"read_at": datetime.now(timezone.utc)}, synchronize_session=False)
+        db.commit()
     
     return result
 
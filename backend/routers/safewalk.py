@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import exists, func, insert
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone, timedelta
-from typing import List
-from .. import models, schemas, database, utils
+from typing import List, Tuple
+from .. import models, schemas, database, utils, alert_service, safewalk_monitor
 
 router = APIRouter(tags=["SafeWalk"])
 
+MAX_CHECKIN_BATCH = 1000
+TRACK_DEFAULT_TOLERANCE_M = 10.0
+
 @router.post("/safewalk/start", response_model=schemas.SafeWalkOut, status_code=status.HTTP_201_CREATED)
 def start_safe_walk(session_data: schemas.SafeWalkCreate, current_user: models.User = Depends(utils.get_active_user), db: Session = Depends(database.get_db)):
     # Check if active session exists
@@ -36,14 +40,77 @@ def start_safe_walk(session_data: schemas.SafeWalkCreate, current_user: models.U
     db.add(new_session)
     db.commit()
     db.refresh(new_session)
+    safewalk_monitor.schedule(new_session)
     
     return new_session
 
 @router.post("/safewalk/{session_id}/checkin")
 def check_in(session_id: int, location: schemas.SafeWalkUpdate, current_user: models.User = Depends(utils.get_current_user), db: Session = Depends(database.get_db)):
+    record_checkin(db, session_id, current_user.id, location.latitude, location.longitude)
+    return {"message": "Location updated"}
+
+@router.post("/safewalk/{session_id}/checkin/batch")
+def check_in_batch(session_id: int, batch: schemas.SafeWalkCheckinBatch, current_user: models.User = Depends(utils.get_current_user), db: Session = Depends(database.get_db)):
+    """Upload many trail points at once, e.g. after the client was offline"""
+    if not batch.points:
+        raise HTTPException(status_code=400, detail="No points supplied")
+    if len(batch.points) > MAX_CHECKIN_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_CHECKIN_BATCH} points per batch")
+    now = datetime.now(timezone.utc)
+    points = [(p.latitude, p.longitude, _as_utc(p.recorded_at) if p.recorded_at else now) for p in batch.points]
+    record_checkins(db, session_id, current_user.id, points)
+    return {"message": "Location updated", "points": len(points)}
+
+@router.get("/safewalk/{session_id}/track", response_model=schemas.SafeWalkTrackOut)
+def get_track(
+    session_id: int,
+    tolerance_m: float = Query(TRACK_DEFAULT_TOLERANCE_M, ge=0, le=1000),
+    current_user: models.User = Depends(utils.get_active_user),
+    db: Session = Depends(database.get_db)
+):
+    """Breadcrumb trail simplified to tolerance_m metres (0 returns every point)"""
+    session = db.query(models.SafeWalkSession).filter(models.SafeWalkSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if not _can_view_track(db, session, current_user):
+        raise HTTPException(status_code=403, detail="Not authorized to view this trail")
+
+    rows = db.query(
+        models.SafeWalkPoint.latitude, models.SafeWalkPoint.longitude, models.SafeWalkPoint.recorded_at
+    ).filter(
+        models.SafeWalkPoint.session_id == session_id
+    ).order_by(models.SafeWalkPoint.recorded_at, models.SafeWalkPoint.id).all()
+
+    keep = utils.simplify_track([r[0] for r in rows], [r[1] for r in rows], tolerance_m)
+    return {
+        "session_id": session_id,
+        "tolerance_m": tolerance_m,
+        "total_points": len(rows),
+        "points": [list(rows[i]) for i in keep.tolist()],
+    }
+
+def _can_view_track(db: Session, session: models.SafeWalkSession, user: models.User) -> bool:
+    """The walker, admins, and officers responding to an alert this session raised"""
+    if session.user_id == user.id or user.user_type == 'admin':
+        return True
+    if user.user_type != 'police' or user.approval_status != 'approved':
+        return False
+    return db.query(exists().where(
+        models.AlertResponse.officer_id == user.id,
+        models.AlertResponse.status != 'cancelled',
+        models.AlertResponse.alert_id == models.Alert.id,
+        models.Alert.safe_walk_session_id == session.id
+    )).scalar()
+
+def record_checkin(db: Session, session_id: int, user_id: int, latitude: float, longitude: float) -> models.SafeWalkSession:
+    """Store a Safe Walk position (shared by the HTTP check-in and the socket location stream)"""
+    return record_checkins(db, session_id, user_id, [(latitude, longitude, datetime.now(timezone.utc))])
+
+def record_checkins(db: Session, session_id: int, user_id: int, points: List[Tuple[float, float, datetime]]) -> models.SafeWalkSession:
+    """Append (latitude, longitude, recorded_at) points to the trail and move the session to the newest one"""
     session = db.query(models.SafeWalkSession).filter(
         models.SafeWalkSession.id == session_id,
-        models.SafeWalkSession.user_id == current_user.id
+        models.SafeWalkSession.user_id == user_id
     ).first()
     
     if not session:
@@ -52,18 +119,30 @@ def check_in(session_id: int, location: schemas.SafeWalkUpdate, current_user: mo
     if session.status != 'active':
         raise HTTPException(status_code=400, detail="Session is not active")
     
-    session.current_latitude = location.latitude
-    session.current_longitude = location.longitude
+    last_recorded = db.query(func.max(models.SafeWalkPoint.recorded_at)).filter(
+        models.SafeWalkPoint.session_id == session_id
+    ).scalar()
+    db.execute(insert(models.SafeWalkPoint), [
+        {"session_id": session_id, "latitude": lat, "longitude": lon, "recorded_at": recorded_at}
+        for lat, lon, recorded_at in points
+    ])
+    # A late offline batch must not move the session back behind a live check-in
+    latitude, longitude, recorded_at = max(points, key=lambda p: p[2])
+    if last_recorded is None or recorded_at >= _as_utc(last_recorded):
+        session.current_latitude = latitude
+        session.current_longitude = longitude
     db.commit()
-    
-    return {"message": "Location updated"}
+    return session
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
 
 @router.post("/safewalk/{session_id}/end")
 def end_safe_walk(session_id: int, current_user: models.User = Depends(utils.get_current_user), db: Session = Depends(database.get_db)):
     session = db.query(models.SafeWalkSession).filter(
         models.SafeWalkSession.id == session_id,
         models.SafeWalkSession.user_id == current_user.id
-    ).first()
+    ).with_for_update().first()
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -74,6 +153,7 @@ def end_safe_walk(session_id: int, current_user: models.User = Depends(utils.get
     session.status = 'completed'
     session.end_time = datetime.now(timezone.utc) # Update end time to actual completion
     db.commit()
+    safewalk_monitor.cancel(session_id)
     
     return {"message": "Safe Walk completed successfully"}
 
@@ -82,7 +162,7 @@ def panic_button(session_id: int, current_user: models.User = Depends(utils.get_
     session = db.query(models.SafeWalkSession).filter(
         models.SafeWalkSession.id == session_id,
         models.SafeWalkSession.user_id == current_user.id
-    ).first()
+    ).with_for_update().first()
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -91,16 +171,16 @@ def panic_button(session_id: int, current_user: models.User = Depends(utils.get_
     session.end_time = datetime.now(timezone.utc)
     
     # Create actual Alert
-    new_alert = models.Alert(
-        user_id=current_user.id,
-        alert_type='sos',
+    new_alert = alert_service.build_alert(
+        current_user.id, 'sos',
+        session.current_latitude or session.start_latitude,
+        session.current_longitude or session.start_longitude,
         content="Panic button pressed during Safe Walk.",
-        latitude=session.current_latitude or session.start_latitude,
-        longitude=session.current_longitude or session.start_longitude,
-        tag='police',
-        status='pending'
+        safe_walk_session_id=session.id
     )
     db.add(new_alert)
     db.commit()
+    safewalk_monitor.cancel(session_id)
+    alert_service.publish(new_alert, sender=current_user)
     
     return {"message": "Emergency alert triggered!", "alert_id": new_alert.id}
@@ -3,9 +3,10 @@ from sqlalchemy.orm import Session
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 import shutil
-from .. import models, schemas, database, utils
+from .. import models, schemas, database, utils, dispatch
 from ..ocr_service import ocr_service
 from ..email_service import email_service
+from ..location_stream import record_location
 
 router = APIRouter(tags=["Users"])
 
@@ -174,11 +175,9 @@ def update_profile(request: schemas.ProfileUpdate, current_user: models.User = D
     return current_user
 
 @router.put("/location")
-def update_location(location: schemas.LocationUpdate, current_user: models.User = Depends(utils.get_approved_user), db: Session = Depends(database.get_db)):
-    current_user.last_latitude = location.latitude
-    current_user.last_longitude = location.longitude
-    current_user.last_location_update = datetime.now(timezone.utc)
-    db.commit()
+async def update_location(location: schemas.LocationUpdate, current_user: models.User = Depends(utils.get_approved_user)):
+    # Buffered and written to users.last_* in bulk by the location flusher
+    await record_location(current_user.id, dispatch.is_dispatchable(current_user), location.latitude, location.longitude)
     return {"message": "Location updated"}
 
 @router.put("/push-token")
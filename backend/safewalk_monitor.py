@@ -1,56 +1,189 @@
+import os
+import heapq
 import time
 import threading
 from datetime import datetime, timezone
-from . import models
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, update
+from . import models, alert_service
 from .database import SessionLocal
 
-def monitor_safe_walk_sessions():
+# Full sweep of active sessions, a safety net for sessions started or changed
+# on another worker and anything the deadline heap missed
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("SAFEWALK_RECONCILE_SECONDS", 60))
+EXPIRY_BATCH_SIZE = 100
+
+
+def _timestamp(value: datetime) -> float:
+    # Naive datetimes are UTC (as stored by the sessions table)
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class DeadlineScheduler:
     """
-    Background loop to check for expired Safe Walk sessions.
-    If a session expires (current_time > end_time) and is still 'active',
-    it triggers an emergency alert.
+    Min-heap of Safe Walk end times. Rescheduling or cancelling a session does
+    not touch the heap; stale entries are skipped when they reach the top.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int]] = []
+        self._deadlines: Dict[int, float] = {}
+
+    def schedule(self, session_id: int, end_time: datetime):
+        deadline = _timestamp(end_time)
+        with self._cond:
+            self._deadlines[session_id] = deadline
+            heapq.heappush(self._heap, (deadline, session_id))
+            self._cond.notify()
+
+    def cancel(self, session_id: int):
+        with self._cond:
+            self._deadlines.pop(session_id, None)
+
+    def replace_all(self, sessions: List[Tuple[int, datetime]]):
+        with self._cond:
+            self._deadlines = {session_id: _timestamp(end_time) for session_id, end_time in sessions}
+            self._heap = [(deadline, session_id) for session_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def wait_due(self, timeout: float) -> List[int]:
+        """Block until at least one deadline passes (or timeout) and return the due session ids"""
+        give_up = time.time() + timeout
+        with self._cond:
+            while True:
+                self._drop_stale()
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    due = []
+                    while self._heap and self._heap[0][0] <= now:
+                        deadline, session_id = heapq.heappop(self._heap)
+                        if self._deadlines.get(session_id) == deadline:
+                            del self._deadlines[session_id]
+                            due.append(session_id)
+                    return due
+                if now >= give_up:
+                    return []
+                next_deadline = self._heap[0][0] if self._heap else give_up
+                self._cond.wait(min(next_deadline, give_up) - now)
+
+    def _drop_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+
+deadlines = DeadlineScheduler()
+
+
+def schedule(session: models.SafeWalkSession):
+    """Call after a session is started or its end time changes"""
+    if session.status == 'active':
+        deadlines.schedule(session.id, session.end_time)
+    else:
+        deadlines.cancel(session.id)
+
+
+def cancel(session_id: int):
+    """Call after a session is ended or escalated by the user"""
+    deadlines.cancel(session_id)
+
+
+def _claim_expired(db, session_ids: Optional[List[int]]):
+    """
+    Atomically flip up to EXPIRY_BATCH_SIZE overdue active sessions to
+    'emergency_triggered' and return them. Rows another worker is claiming
+    are skipped (SKIP LOCKED), and a row already claimed no longer matches
+    status = 'active', so each session is triggered exactly once.
+    """
+    SafeWalk = models.SafeWalkSession
+    candidates = select(SafeWalk.id).where(
+        SafeWalk.status == 'active',
+        SafeWalk.end_time <= datetime.now(timezone.utc)
+    )
+    if session_ids is not None:
+        candidates = candidates.where(SafeWalk.id.in_(session_ids))
+    candidates = candidates.order_by(SafeWalk.end_time).limit(EXPIRY_BATCH_SIZE).with_for_update(skip_locked=True)
+    return db.execute(
+        update(SafeWalk)
+        .where(SafeWalk.id.in_(candidates.scalar_subquery()), SafeWalk.status == 'active')
+        .values(status='emergency_triggered')
+        .returning(SafeWalk.id, SafeWalk.user_id, SafeWalk.start_latitude, SafeWalk.start_longitude,
+                   SafeWalk.current_latitude, SafeWalk.current_longitude)
+    ).all()
+
+
+def expire_sessions(session_ids: Optional[List[int]] = None):
+    """
+    Trigger an emergency alert for every given session (or all sessions) that
+    is still active past its end time. Safe to run from any number of workers.
     """
-    print("🛡️  Safe Walk Monitor Started")
     while True:
+        db = SessionLocal()
         try:
-            db = SessionLocal()
-            now = datetime.now(timezone.utc)
-            
-            # Find expired active sessions
-            expired_sessions = db.query(models.SafeWalkSession).filter(
-                models.SafeWalkSession.status == 'active',
-                models.SafeWalkSession.end_time < now
-            ).all()
-            
+            expired_sessions = _claim_expired(db, session_ids)
+
+            new_alerts = []
             for session in expired_sessions:
                 print(f"🚨 Safe Walk Expired for User {session.user_id}. Triggering Alert!")
-                
-                # Update status
-                session.status = 'emergency_triggered'
-                
+
                 # Create Emergency Alert
-                new_alert = models.Alert(
-                    user_id=session.user_id,
-                    alert_type='sos',
+                new_alert = alert_service.build_alert(
+                    session.user_id, 'sos',
+                    session.current_latitude or session.start_latitude,
+                    session.current_longitude or session.start_longitude,
                     content="Safe Walk timer expired. User did not check in.",
-                    latitude=session.current_latitude or session.start_latitude,
-                    longitude=session.current_longitude or session.start_longitude,
-                    tag='police',
-                    status='pending',
-                    transcription_status='none'
+                    safe_walk_session_id=session.id
                 )
                 db.add(new_alert)
-                
+                new_alerts.append(new_alert)
+
                 # In a real app, we would also trigger SMS/Push notifications here
-            
+
+            # The claim and its alerts commit together; a failure releases the rows
             db.commit()
+            for alert in new_alerts:
+                try:
+                    alert_service.publish(alert)
+                except Exception as e:
+                    print(f"Error publishing Safe Walk alert {alert.id}: {e}")
+        finally:
             db.close()
-            
+        if len(expired_sessions) < EXPIRY_BATCH_SIZE:
+            return
+
+
+def reconcile():
+    """Reload every active session's deadline; overdue ones fire on the next wait"""
+    db = SessionLocal()
+    try:
+        rows = db.query(models.SafeWalkSession.id, models.SafeWalkSession.end_time).filter(
+            models.SafeWalkSession.status == 'active'
+        ).all()
+        deadlines.replace_all([(session_id, end_time) for session_id, end_time in rows])
+    finally:
+        db.close()
+
+
+def monitor_safe_walk_sessions():
+    """
+    Background loop that expires Safe Walk sessions at their end time.
+    If a session expires (current_time > end_time) and is still 'active',
+    it triggers an emergency alert.
+    """
+    print("🛡️  Safe Walk Monitor Started")
+    next_reconcile = 0.0
+    while True:
+        try:
+            if time.monotonic() >= next_reconcile:
+                reconcile()
+                next_reconcile = time.monotonic() + RECONCILE_INTERVAL_SECONDS
+            due = deadlines.wait_due(timeout=max(next_reconcile - time.monotonic(), 0))
+            if due:
+                expire_sessions(due)
         except Exception as e:
             print(f"Error in Safe Walk Monitor: {e}")
-        
-        # Check every 30 seconds
-        time.sleep(30)
+            time.sleep(1)
 
 def start_monitor():
     thread = threading.Thread(target=monitor_safe_walk_sessions, daemon=True)
@@ -392,6 +392,21 @@ class SafeWalkUpdate(BaseModel):
     latitude: float
     longitude: float
 
+class SafeWalkPointIn(BaseModel):
+    latitude: float
+    longitude: float
+    recorded_at: Optional[datetime] = None  # defaults to the time the batch is received
+
+class SafeWalkCheckinBatch(BaseModel):
+    points: List[SafeWalkPointIn]
+
+class SafeWalkTrackOut(BaseModel):
+    session_id: int
+    tolerance_m: float
+    total_points: int
+    # [latitude, longitude, recorded_at] in time order
+    points: List[list]
+
 class SafeWalkOut(BaseModel):
     id: int
     user_id: int
@@ -403,3 +418,13 @@ class SafeWalkOut(BaseModel):
     
     class Config:
         from_attributes = True
+
+class TranscriptionQueueStats(BaseModel):
+    queued: int
+    running: int
+    completed: int
+    failed: int
+    oldest_queued_seconds: Optional[float] = None
+    avg_wait_seconds_last_hour: Optional[float] = None
+    avg_run_seconds_last_hour: Optional[float] = None
+    workers_per_process: int
@@ -1,15 +1,112 @@
+import os
+import asyncio
 import socketio
+from typing import Dict, Optional, Set
+from urllib.parse import parse_qs
+from jose import JWTError, jwt
+from . import models, utils
+from .database import SessionLocal
+
+def _client_manager():
+    """
+    Pick the Socket.IO client manager from SOCKETIO_MESSAGE_QUEUE.
+    Unset (or memory://) keeps rooms in this process, which only works with a
+    single worker. With a broker URL every worker subscribes to the same
+    channel, so an emit from any worker reaches sockets connected to all of
+    them: redis://, rediss://, unix:// or valkey:// (Redis-compatible), amqp://.
+    """
+    url = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+    channel = os.getenv("SOCKETIO_CHANNEL", "sosapp")
+    if not url or url.startswith("memory://"):
+        return None
+    if url.startswith(("amqp://", "amqps://")):
+        return socketio.AsyncAioPikaManager(url, channel=channel)
+    return socketio.AsyncRedisManager(url, channel=channel)
 
 # Create a Socket.IO server capable of handling async requests
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', client_manager=_client_manager())
 app = socketio.ASGIApp(sio)
 
+# Officers are kept in the geo rooms of their current geohash cell and its
+# 8 neighbours, so an alert only needs to be emitted to its own cell's room
+GEO_ROOM_PRECISION = 4  # ~39km x 19km cells
+
+_sid_geo_rooms: Dict[str, Set[str]] = {}
+_officer_cells: Dict[int, str] = {}
+_local_officers: Dict[str, int] = {}  # sid -> officer id, sockets connected to this worker
+
+def geo_room(cell: str) -> str:
+    return f"geo_{cell}"
+
+def geo_room_for(latitude: float, longitude: float) -> str:
+    """Room reaching every officer whose neighbourhood contains this point"""
+    return geo_room(utils.geohash_encode(latitude, longitude, GEO_ROOM_PRECISION))
+
+def _user_from_token(token: Optional[str]) -> Optional[models.User]:
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, utils.SECRET_KEY, algorithms=[utils.ALGORITHM])
+    except JWTError:
+        return None
+    db = SessionLocal()
+    try:
+        return db.query(models.User).filter(models.User.cnic == payload.get("sub")).first()
+    finally:
+        db.close()
+
+async def _place_sid(sid: str, cell: str):
+    rooms = {geo_room(c) for c in utils.geohash_neighbors(cell)}
+    current = _sid_geo_rooms.get(sid, set())
+    for room in current - rooms:
+        await sio.leave_room(sid, room)
+    for room in rooms - current:
+        await sio.enter_room(sid, room)
+    _sid_geo_rooms[sid] = rooms
+
+def local_officer_ids() -> Set[int]:
+    return set(_local_officers.values())
+
+async def place_officer(user_id: int, latitude: float, longitude: float):
+    """Move an officer's sockets on this worker into the geo rooms around their position"""
+    cell = utils.geohash_encode(latitude, longitude, GEO_ROOM_PRECISION)
+    if _officer_cells.get(user_id) == cell:
+        return
+    _officer_cells[user_id] = cell
+    sids = [sid for sid, _ in sio.manager.get_participants('/', f"user_{user_id}")]
+    for sid in sids:
+        await _place_sid(sid, cell)
+
+async def disconnect_officer(user_id: int):
+    """
+    Drop an officer's sockets on this worker, e.g. after a suspension. The
+    session was authorised at connect; a reconnect re-reads the account, so
+    the officer is no longer approved for location updates or geo rooms.
+    """
+    for sid in [sid for sid, officer_id in _local_officers.items() if officer_id == user_id]:
+        await sio.disconnect(sid)
+    _officer_cells.pop(user_id, None)
+
 @sio.event
 async def connect(sid, environ):
+    # Clients pass their JWT as ?token=...; it identifies officers for geo rooms
+    token = parse_qs(environ.get('QUERY_STRING', '')).get('token', [None])[0]
+    # The user lookup is a blocking query; keep it off the event loop
+    user = await asyncio.to_thread(_user_from_token, token)
+    if user:
+        await sio.save_session(sid, {
+            "user_id": user.id,
+            "user_type": user.user_type,
+            # Same rule as utils.get_approved_user
+            "approved": user.account_status == 'active'
+                        and not (user.user_type == 'police' and user.approval_status != 'approved'),
+        })
     print(f"Socket Connected: {sid}")
 
 @sio.event
 async def disconnect(sid):
+    _sid_geo_rooms.pop(sid, None)
+    _local_officers.pop(sid, None)
     print(f"Socket Disconnected: {sid}")
 
 @sio.event
@@ -18,6 +115,14 @@ async def join_room(sid, room):
     await sio.enter_room(sid, room)
     print(f"Socket {sid} joined room {room}")
 
+    # An officer's own room: place the socket around their last known cell
+    session = await sio.get_session(sid)
+    if session.get("user_type") == 'police' and session.get("approved") and room == f"user_{session['user_id']}":
+        _local_officers[sid] = session["user_id"]
+        cell = _officer_cells.get(session["user_id"])
+        if cell:
+            await _place_sid(sid, cell)
+
 @sio.event
 async def leave_room(sid, room):
     await sio.leave_room(sid, room)
@@ -0,0 +1,124 @@
+"""
+Speech-to-text engines behind one interface.
+
+TRANSCRIPTION_BACKEND picks the engine, TRANSCRIPTION_MODEL its model size
+and TRANSCRIPTION_THREADS the CPU threads it may use (0 = library default):
+
+- whisper: OpenAI Whisper on PyTorch (openai-whisper, the default).
+- faster-whisper: the same models converted for CTranslate2 and run with
+  int8 weights, several times faster on CPU, so a larger model fits in the
+  same latency budget. Needs `pip install faster-whisper`.
+
+Both take 16 kHz mono float32 audio; each also brings its own decoder so the
+other library does not need to be installed.
+"""
+
+import abc
+import os
+from typing import Dict, Iterator, Optional, Tuple, Type
+import numpy as np
+from .audio_preprocessing import SAMPLE_RATE
+
+DEFAULT_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "whisper")
+DEFAULT_MODEL = os.getenv("TRANSCRIPTION_MODEL", "tiny")
+DEFAULT_THREADS = int(os.getenv("TRANSCRIPTION_THREADS", 0))
+
+# Audio per transcribe() call for engines that cannot stream segments. Whisper
+# pads every input to a 30 s window, so shorter chunks would only add encoder passes
+TRANSCRIPTION_CHUNK_SECONDS = int(os.getenv("TRANSCRIPTION_CHUNK_SECONDS", 30))
+PROMPT_CHARS = 200
+
+
+class TranscriptionBackend(abc.ABC):
+    name = ""
+
+    def __init__(self, model_size: str, threads: int = 0):
+        self.model_size = model_size
+        self.threads = threads
+
+    @abc.abstractmethod
+    def decode(self, audio_path: str) -> np.ndarray:
+        """Decode a file to 16 kHz mono float32 PCM"""
+
+    @abc.abstractmethod
+    def transcribe(self, audio: np.ndarray, prompt: Optional[str] = None) -> str:
+        """Transcribe 16 kHz mono float32 audio; prompt is preceding text for context"""
+
+    def transcribe_segments(self, audio: np.ndarray, prompt: Optional[str] = None) -> Iterator[Tuple[str, float]]:
+        """
+        Yield (text, end time in seconds) for each segment as soon as it is
+        decoded. By default the audio is transcribed TRANSCRIPTION_CHUNK_SECONDS
+        at a time, each window prompted with the text so far to keep the
+        wording consistent across the cut; engines that stream override this.
+        """
+        window = TRANSCRIPTION_CHUNK_SECONDS * SAMPLE_RATE
+        text_so_far = prompt or ""
+        for start in range(0, len(audio), window):
+            piece = self.transcribe(audio[start:start + window], prompt=text_so_far[-PROMPT_CHARS:] or None)
+            if piece:
+                text_so_far = f"{text_so_far} {piece}".lstrip()
+            yield piece, min(start + window, len(audio)) / SAMPLE_RATE
+
+    def __repr__(self):
+        return f"{self.name}:{self.model_size}"
+
+
+class WhisperBackend(TranscriptionBackend):
+    name = "whisper"
+
+    def __init__(self, model_size: str, threads: int = 0):
+        super().__init__(model_size, threads)
+        import whisper
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = whisper.load_model(model_size)
+
+    def decode(self, audio_path: str) -> np.ndarray:
+        import whisper
+        return whisper.load_audio(audio_path)
+
+    def transcribe(self, audio: np.ndarray, prompt: Optional[str] = None) -> str:
+        result = self.model.transcribe(audio, fp16=False, initial_prompt=prompt)
+        return result["text"].strip()
+
+
+class FasterWhisperBackend(TranscriptionBackend):
+    name = "faster-whisper"
+    compute_type = "int8"
+
+    def __init__(self, model_size: str, threads: int = 0):
+        super().__init__(model_size, threads)
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("TRANSCRIPTION_BACKEND=faster-whisper needs: pip install faster-whisper")
+        self.model = WhisperModel(model_size, device="cpu", compute_type=self.compute_type, cpu_threads=threads)
+
+    def decode(self, audio_path: str) -> np.ndarray:
+        from faster_whisper import decode_audio
+        return decode_audio(audio_path, sampling_rate=SAMPLE_RATE)
+
+    def transcribe(self, audio: np.ndarray, prompt: Optional[str] = None) -> str:
+        return " ".join(text for text, _ in self.transcribe_segments(audio, prompt) if text)
+
+    def transcribe_segments(self, audio: np.ndarray, prompt: Optional[str] = None) -> Iterator[Tuple[str, float]]:
+        # Segments are generated lazily; each one is decoded as it is consumed
+        segments, _ = self.model.transcribe(audio, initial_prompt=prompt)
+        for segment in segments:
+            yield segment.text.strip(), segment.end
+
+
+BACKENDS: Dict[str, Type[TranscriptionBackend]] = {
+    WhisperBackend.name: WhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+
+def load_backend(name: Optional[str] = None, model_size: Optional[str] = None,
+                 threads: Optional[int] = None) -> TranscriptionBackend:
+    """Load an engine, defaulting to the TRANSCRIPTION_* settings"""
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend '{name}' (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name](model_size or DEFAULT_MODEL, DEFAULT_THREADS if threads is None else threads)
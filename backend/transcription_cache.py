@@ -0,0 +1,81 @@
+"""
+Content-hash cache of transcription results.
+
+Clients retrying through the offline queue often upload the same clip more
+than once. Results are stored under the SHA-256 of the audio bytes together
+with the backend, model and preprocessing version that produced them, so
+identical audio is answered from the database without running Whisper, and
+switching to a better model never serves the old model's transcripts. The
+table is kept to TRANSCRIPTION_CACHE_MAX_ENTRIES rows, evicting the least
+recently used entries.
+"""
+
+import os
+import hashlib
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from . import models, audio_preprocessing, transcription_backends
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", 10000))
+_READ_CHUNK = 1024 * 1024
+
+
+def cache_key_prefix(backend: Optional[str] = None, model: Optional[str] = None,
+                     version: Optional[int] = None) -> bytes:
+    """What produced a transcript, hashed in ahead of the audio bytes; defaults to the current settings"""
+    backend = backend or transcription_backends.DEFAULT_BACKEND
+    model = model or transcription_backends.DEFAULT_MODEL
+    version = audio_preprocessing.PREPROCESSING_VERSION if version is None else version
+    return f"{backend}:{model}:preprocessing-{version}\n".encode()
+
+
+def audio_digest(audio_path: str) -> Optional[str]:
+    """Cache key of a clip: SHA-256 of cache_key_prefix() and its bytes, or None if the file is missing"""
+    path = Path(audio_path)
+    if not path.exists():
+        return None
+    digest = hashlib.sha256(cache_key_prefix())
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def lookup(db, digest: Optional[str]) -> Optional[Tuple[str, List[str]]]:
+    """Cached (transcription, keywords) for this audio; marks the entry as used"""
+    if digest is None:
+        return None
+    entry = db.query(models.TranscriptionCacheEntry).filter(
+        models.TranscriptionCacheEntry.audio_sha256 == digest
+    ).first()
+    if entry is None:
+        return None
+    entry.hits += 1
+    entry.last_used_at = datetime.now(timezone.utc)
+    keywords = entry.keywords.split(", ") if entry.keywords else []
+    return entry.transcription, keywords
+
+
+def store(db, digest: Optional[str], transcription: str, keywords: List[str]):
+    """Add a result in its own savepoint and evict the oldest entries beyond the limit"""
+    if digest is None:
+        return
+    Entry = models.TranscriptionCacheEntry
+    try:
+        with db.begin_nested():
+            db.add(Entry(audio_sha256=digest, transcription=transcription,
+                         keywords=", ".join(keywords) if keywords else None,
+                         last_used_at=datetime.now(timezone.utc)))
+    except IntegrityError:
+        # Another worker cached the same clip first
+        return
+    excess = db.query(func.count(Entry.audio_sha256)).scalar() - CACHE_MAX_ENTRIES
+    if excess > 0:
+        oldest = select(Entry.audio_sha256).order_by(Entry.last_used_at).limit(excess)
+        db.execute(delete(Entry).where(Entry.audio_sha256.in_(oldest.scalar_subquery())))
@@ -0,0 +1,352 @@
+"""
+Durable transcription job queue.
+
+Voice alerts are queued as rows in transcription_jobs instead of each getting
+its own thread. TRANSCRIPTION_WORKERS threads per API process claim jobs
+one job at a time (highest priority first, FOR UPDATE SKIP LOCKED) and hand
+it to a warm transcription process, so any number of API workers can share the
+queue and a surge of voice alerts keeps every process busy without running
+more inferences at once than the pool allows. Finished transcripts go to a
+keyword stage that extracts keywords for everything finished meanwhile in one
+spaCy batch, then completes the jobs. Failed jobs are retried with exponential
+backoff. A job's lease is renewed while it runs; jobs survive restarts: a
+running job whose lease expired is requeued, and voice alerts still marked
+pending without a job are enqueued by the maintenance sweep.
+"""
+
+import os
+import queue
+import threading
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import exists, func, select, update
+from . import models, alert_index, alert_service, transcription_cache
+from .database import SessionLocal
+from . import transcription_service
+from .transcription_service import audio_path_for, transcribe_in_pool, extract_keywords_in_pool
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", 2))
+MAX_ATTEMPTS = int(os.getenv("TRANSCRIPTION_MAX_ATTEMPTS", 3))
+RETRY_BASE_SECONDS = 10
+LEASE_SECONDS = int(os.getenv("TRANSCRIPTION_LEASE_SECONDS", 300))
+# Running jobs extend their lease this often, so recover() only requeues dead ones
+LEASE_RENEW_SECONDS = LEASE_SECONDS / 3
+POLL_SECONDS = 2
+MAINTENANCE_INTERVAL_SECONDS = 60
+
+# New alerts are transcribed before backlog recovered after a restart
+PRIORITY_LIVE = 10
+PRIORITY_RECOVERED = 0
+
+_wakeup = threading.Event()
+# (job, audio digest, transcription) waiting for keyword extraction
+_keyword_queue: "queue.Queue" = queue.Queue()
+
+
+def enqueue(db, alert_id: int, audio_path: str, priority: int = PRIORITY_LIVE):
+    """Add a job in the caller's transaction; wake() once it is committed"""
+    db.add(models.TranscriptionJob(alert_id=alert_id, audio_path=audio_path, priority=priority))
+
+
+def transcribe_or_enqueue(db, alert: models.Alert, audio_path: str):
+    """
+    Fill in the transcript straight away if this exact clip was transcribed
+    before, otherwise queue a job. Runs in the caller's transaction.
+    """
+    cached = transcription_cache.lookup(db, transcription_cache.audio_digest(audio_path))
+    if cached:
+        transcription, keywords = cached
+        alert.transcription = transcription
+        alert.transcription_keywords = ", ".join(keywords) if keywords else None
+        alert.transcription_status = 'completed'
+        return
+    db.flush()
+    enqueue(db, alert.id, audio_path)
+
+
+def wake():
+    _wakeup.set()
+
+
+def claim_jobs(db, limit: int = 1):
+    """Atomically mark up to `limit` ready jobs as running and return them"""
+    Job = models.TranscriptionJob
+    now = datetime.now(timezone.utc)
+    candidates = select(Job.id).where(
+        Job.status == 'queued',
+        Job.available_at <= now
+    ).order_by(Job.priority.desc(), Job.available_at, Job.id).limit(limit).with_for_update(skip_locked=True)
+    jobs = db.execute(
+        update(Job)
+        .where(Job.id.in_(candidates.scalar_subquery()), Job.status == 'queued')
+        .values(status='running', attempts=Job.attempts + 1, started_at=now,
+                leased_until=now + timedelta(seconds=LEASE_SECONDS))
+        .returning(Job.id, Job.alert_id, Job.audio_path, Job.attempts, Job.created_at, Job.priority)
+    ).all()
+    db.commit()
+    # RETURNING order is unspecified
+    return sorted(jobs, key=lambda job: (-job.priority, job.created_at, job.id))
+
+
+def renew_leases(job_ids):
+    """Extend the lease of jobs that are still running"""
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(models.TranscriptionJob)
+            .where(models.TranscriptionJob.id.in_(job_ids), models.TranscriptionJob.status == 'running')
+            .values(leased_until=datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS))
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _finish(job_id: int, alert_id: int, transcription: Optional[str], keywords, error: Optional[str], retry: bool,
+            digest: Optional[str] = None):
+    db = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        job = db.query(models.TranscriptionJob).filter(models.TranscriptionJob.id == job_id).first()
+        alert = db.query(models.Alert).filter(models.Alert.id == alert_id).first()
+        if job is None:
+            return
+        job.finished_at = now
+        job.leased_until = None
+        if error is None:
+            job.status = 'completed'
+            job.last_error = None
+            if alert:
+                alert.transcription = transcription
+                alert.transcription_keywords = ", ".join(keywords) if keywords else None
+                alert.transcription_status = 'completed'
+            transcription_cache.store(db, digest, transcription, keywords)
+        elif retry and job.attempts < MAX_ATTEMPTS:
+            job.status = 'queued'
+            job.last_error = error
+            job.available_at = now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.last_error = error
+            if alert:
+                alert.transcription_status = 'failed'
+        db.commit()
+        if alert and job.status != 'queued':
+            alert_index.alert_changed(alert)
+        if alert and job.status == 'completed':
+            # Viewers following the partial transcripts get the finished text too
+            alert_service.notify_viewers(alert, 'transcription_partial', {
+                "alert_id": alert_id, "transcription": transcription,
+                "keywords": alert.transcription_keywords, "final": True
+            })
+    finally:
+        db.close()
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def run_job(job):
+    """Serve a cached clip directly, otherwise transcribe it in a worker process and queue it for keywords"""
+    wait = (datetime.now(timezone.utc) - _as_utc(job.created_at)).total_seconds() if job.created_at else 0.0
+    logger.info(f"Starting transcription for alert {job.alert_id} (attempt {job.attempts}, waited {wait:.1f}s)")
+    digest = transcription_cache.audio_digest(job.audio_path)
+    db = SessionLocal()
+    try:
+        cached = transcription_cache.lookup(db, digest)
+        db.commit()
+    finally:
+        db.close()
+    if cached:
+        logger.info(f"Transcription for alert {job.alert_id} served from cache")
+        _finish(job.id, job.alert_id, *cached, None, retry=False)
+        return
+
+    start = time.perf_counter()
+    try:
+        result = transcribe_in_pool(job.alert_id, job.audio_path,
+                                    on_wait=lambda: renew_leases([job.id]), wait_seconds=LEASE_RENEW_SECONDS)
+    except Exception as e:
+        logger.error(f"Transcription error for alert {job.alert_id}: {e}")
+        _finish(job.id, job.alert_id, None, None, str(e) or type(e).__name__, retry=True)
+        return
+    if "error" in result:
+        logger.error(f"Transcription failed for alert {job.alert_id} (attempt {job.attempts}): {result['error']}")
+        _finish(job.id, job.alert_id, None, None, result["error"], retry=result["retry"])
+        return
+    logger.info(f"Transcribed alert {job.alert_id} in {time.perf_counter() - start:.2f}s")
+    # The keyword stage may be busy with the previous batch; give it a full lease
+    renew_leases([job.id])
+    _keyword_queue.put((job, digest, result["transcription"]))
+
+
+def complete_with_keywords(items):
+    """Extract keywords for (job, digest, transcription) items in one batch and complete the jobs"""
+    job_ids = [job.id for job, _, _ in items]
+    start = time.perf_counter()
+    try:
+        keywords = extract_keywords_in_pool([text for _, _, text in items],
+                                            on_wait=lambda: renew_leases(job_ids), wait_seconds=LEASE_RENEW_SECONDS)
+    except Exception as e:
+        # The transcripts are what matters; complete them without keywords
+        logger.error(f"Keyword extraction failed for alerts {[job.alert_id for job, _, _ in items]}: {e}")
+        keywords = [[] for _ in items]
+    logger.info(f"Keywords for {len(items)} transcripts in {(time.perf_counter() - start) * 1000:.0f}ms")
+    for (job, digest, transcription), job_keywords in zip(items, keywords):
+        logger.info(f"Transcription completed for alert {job.alert_id}: {len(transcription)} chars, {len(job_keywords)} keywords")
+        _finish(job.id, job.alert_id, transcription, job_keywords, None, retry=False, digest=digest)
+
+
+def _worker_loop():
+    while True:
+        try:
+            _wakeup.clear()
+            db = SessionLocal()
+            try:
+                # One job per worker keeps every pool process busy during a surge
+                jobs = claim_jobs(db)
+            finally:
+                db.close()
+            if not jobs:
+                _wakeup.wait(POLL_SECONDS)
+                continue
+            run_job(jobs[0])
+        except Exception as e:
+            logger.error(f"Transcription worker error: {e}")
+            time.sleep(POLL_SECONDS)
+
+
+def _keyword_loop():
+    while True:
+        try:
+            items = [_keyword_queue.get()]
+            # Everything that finished while the previous batch ran goes in this one
+            while len(items) < transcription_service.KEYWORD_BATCH_SIZE:
+                try:
+                    items.append(_keyword_queue.get_nowait())
+                except queue.Empty:
+                    break
+            complete_with_keywords(items)
+        except Exception as e:
+            logger.error(f"Keyword stage error: {e}")
+            time.sleep(POLL_SECONDS)
+
+
+def publish_partial(alert_id: int, text: str, seconds_done: float, seconds_total: float):
+    """Store a partial transcript on a still-pending alert and push it to the alert's viewers"""
+    db = SessionLocal()
+    try:
+        # Conditional, so a late partial never overwrites the finished transcript
+        updated = db.execute(
+            update(models.Alert)
+            .where(models.Alert.id == alert_id, models.Alert.transcription_status == 'pending')
+            .values(transcription=text)
+        ).rowcount
+        db.commit()
+        if not updated:
+            return
+        alert = db.query(models.Alert).filter(models.Alert.id == alert_id).first()
+        alert_index.alert_changed(alert)
+        alert_service.notify_viewers(alert, 'transcription_partial', {
+            "alert_id": alert_id, "transcription": text,
+            "seconds_done": seconds_done, "seconds_total": seconds_total, "final": False
+        })
+    finally:
+        db.close()
+
+
+def _progress_loop():
+    progress = transcription_service.progress_queue()
+    while True:
+        try:
+            alert_id, text, done, total = progress.get()
+            latest = {alert_id: (text, done, total)}
+            # Coalesce a burst into one write per alert
+            while True:
+                try:
+                    alert_id, text, done, total = progress.get_nowait()
+                except queue.Empty:
+                    break
+                latest[alert_id] = (text, done, total)
+            for alert_id, update_args in latest.items():
+                publish_partial(alert_id, *update_args)
+        except Exception as e:
+            logger.error(f"Partial transcript update failed: {e}")
+            time.sleep(POLL_SECONDS)
+
+
+def recover():
+    """Requeue jobs whose worker died and enqueue pending voice alerts that have no job"""
+    Job = models.TranscriptionJob
+    db = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        db.execute(
+            update(Job)
+            .where(Job.status == 'running', Job.leased_until < now)
+            .values(status='queued', available_at=now, leased_until=None, last_error="Lease expired")
+        )
+        orphans = db.query(models.Alert.id, models.Alert.audio_url).filter(
+            models.Alert.transcription_status == 'pending',
+            models.Alert.audio_url.isnot(None),
+            ~exists().where(Job.alert_id == models.Alert.id)
+        ).all()
+        for alert_id, audio_url in orphans:
+            enqueue(db, alert_id, audio_path_for(audio_url), priority=PRIORITY_RECOVERED)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    wake()
+
+
+def _maintenance_loop():
+    while True:
+        try:
+            recover()
+        except Exception as e:
+            # Another worker may have enqueued the same alert concurrently
+            logger.error(f"Transcription queue recovery failed: {e}")
+        time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+
+def queue_stats(db) -> dict:
+    """Queue depth and wait times for monitoring"""
+    Job = models.TranscriptionJob
+    now = datetime.now(timezone.utc)
+    counts = dict(db.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+    oldest = db.query(func.min(Job.created_at)).filter(Job.status == 'queued').scalar()
+    hour_ago = now - timedelta(hours=1)
+    recent = db.query(Job.created_at, Job.started_at, Job.finished_at).filter(
+        Job.status == 'completed', Job.finished_at >= hour_ago
+    ).all()
+    waits = [(started - created).total_seconds() for created, started, _ in recent if created and started]
+    runs = [(finished - started).total_seconds() for _, started, finished in recent if started and finished]
+    return {
+        "queued": counts.get('queued', 0),
+        "running": counts.get('running', 0),
+        "completed": counts.get('completed', 0),
+        "failed": counts.get('failed', 0),
+        "oldest_queued_seconds": (now - _as_utc(oldest)).total_seconds() if oldest else None,
+        "avg_wait_seconds_last_hour": sum(waits) / len(waits) if waits else None,
+        "avg_run_seconds_last_hour": sum(runs) / len(runs) if runs else None,
+        "workers_per_process": TRANSCRIPTION_WORKERS,
+    }
+
+
+def start_workers():
+    # One claiming thread per worker process; each blocks while its job runs
+    transcription_service.start_pool(TRANSCRIPTION_WORKERS)
+    threading.Thread(target=_progress_loop, daemon=True).start()
+    threading.Thread(target=_keyword_loop, daemon=True).start()
+    threading.Thread(target=_maintenance_loop, daemon=True).start()
+    for _ in range(TRANSCRIPTION_WORKERS):
+        threading.Thread(target=_worker_loop, daemon=True).start()
+    logger.info(f"Transcription queue started with {TRANSCRIPTION_WORKERS} workers")
@@ -1,183 +1,283 @@
 """
-Transcription service using OpenAI Whisper and spaCy for keyword extraction.
-Runs transcription in a background thread to avoid blocking the main API.
+Transcription service using Whisper (see transcription_backends) and spaCy for keyword extraction.
+Jobs are queued by transcription_queue and run in a small pool of worker
+processes that load and warm up both models once, when the pool starts, so
+inference never holds the API process's GIL and no alert waits for a model
+load. The speech engine and spaCy are only imported inside those processes.
 """
 
-import whisper
-import spacy
-import threading
+import os
 import logging
+import multiprocessing
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Optional, Dict, List
-from sqlalchemy.orm import Session
+from typing import Callable, Optional, List
+from . import audio_preprocessing, transcription_backends
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+AUDIO_UPLOAD_DIR = Path("uploads/audio")
+
+# Keyword extraction only reads POS tags, lemmas and entities, so the
+# dependency parser is never loaded
+KEYWORD_DISABLED_PIPES = ["parser"]
+KEYWORD_POS = {'NOUN', 'PROPN', 'VERB', 'ADJ'}
+KEYWORD_ENTITIES = {'GPE', 'LOC', 'ORG', 'PERSON', 'EVENT'}
+KEYWORD_BATCH_SIZE = 32
+
+# Whisper input format
+SAMPLE_RATE = audio_preprocessing.SAMPLE_RATE
+
 # Global model instances (loaded lazily)
-_whisper_model = None
+_transcription_backend = None
 _spacy_model = None
 
 
-def get_whisper_model():
-    """Lazy load Whisper model (small)"""
-    global _whisper_model
-    if _whisper_model is None:
-        logger.info("Loading Whisper 'tiny' model... (optimized for free tier)")
-        _whisper_model = whisper.load_model("tiny")
-        logger.info("Whisper model loaded successfully")
-    return _whisper_model
+def get_transcription_backend() -> transcription_backends.TranscriptionBackend:
+    """Lazy load the configured speech-to-text engine (Whisper 'tiny' by default, for the free tier)"""
+    global _transcription_backend
+    if _transcription_backend is None:
+        _transcription_backend = transcription_backends.load_backend()
+        logger.info(f"Transcription backend {_transcription_backend} loaded successfully")
+    return _transcription_backend
 
 
 def get_spacy_model():
     """Lazy load spaCy model"""
     global _spacy_model
     if _spacy_model is None:
+        import spacy
         try:
-            _spacy_model = spacy.load("en_core_web_sm")
+            _spacy_model = spacy.load("en_core_web_sm", disable=KEYWORD_DISABLED_PIPES)
             logger.info("spaCy model loaded successfully")
         except OSError:
             logger.warning("spaCy model not found. Downloading en_core_web_sm...")
             import subprocess
             subprocess.run(["python", "-m", "spacy", "download", "en_core_web_sm"])
-            _spacy_model = spacy.load("en_core_web_sm")
+            _spacy_model = spacy.load("en_core_web_sm", disable=KEYWORD_DISABLED_PIPES)
     return _spacy_model
 
 
-def transcribe_audio(audio_path: str) -> Optional[str]:
+class TranscriptionError(Exception):
+    """Audio that cannot be transcribed; retrying will not help"""
+
+
+def audio_path_for(audio_url: str) -> str:
+    """Local path of an uploaded clip from its /audio/... URL"""
+    return str(AUDIO_UPLOAD_DIR / audio_url.replace('/audio/', ''))
+
+
+def load_audio(audio_path: str) -> np.ndarray:
+    """Decode a clip once to 16 kHz mono float32 PCM"""
+    if not Path(audio_path).exists():
+        raise TranscriptionError(f"Audio file not found: {audio_path}")
+    try:
+        return get_transcription_backend().decode(audio_path)
+    except Exception as e:
+        raise TranscriptionError(f"Could not decode audio: {e}")
+
+
+def transcribe_audio(audio_path: str, on_partial: Optional[Callable[[str, int, int], None]] = None) -> str:
     """
-    Transcribe audio file using Whisper.
+    Transcribe audio file with the configured backend after trimming silence
+    and capping the length (audio_preprocessing). Text is reported as the
+    backend yields it (TranscriptionBackend.transcribe_segments).
     
     Args:
         audio_path: Path to the audio file
+        on_partial: Called with (text so far, seconds transcribed, total
+            seconds) as text arrives, including at the end, so the full text
+            is shown before its keywords are ready
         
     Returns:
-        Transcribed text or None if failed
-    """
-    try:
-        if not Path(audio_path).exists():
-            logger.error(f"Audio file not found: {audio_path}")
-            return None
+        Transcribed text
         
-        model = get_whisper_model()
-        result = model.transcribe(audio_path)
-        return result["text"].strip()
-    except Exception as e:
-        logger.error(f"Transcription error: {e}")
-        return None
+    Raises:
+        TranscriptionError: if the file is missing, cannot be decoded or
+        contains no speech. Model errors are propagated so the job can be retried.
+    """
+    decoded = load_audio(audio_path)
+    # Silence is trimmed here so the model never sees it; no second decode
+    audio = audio_preprocessing.preprocess(decoded)
+    total_seconds = len(audio) / SAMPLE_RATE
+    logger.info(f"Audio {Path(audio_path).name}: {len(decoded) / SAMPLE_RATE:.1f}s decoded, "
+                f"{total_seconds:.1f}s after trimming")
+    if len(audio) == 0:
+        raise TranscriptionError("No speech detected")
+    backend = get_transcription_backend()
+    pieces = []
 
+    def report(seconds_done: float):
+        if on_partial is not None and pieces:
+            on_partial(" ".join(pieces), round(min(seconds_done, total_seconds), 1), round(total_seconds, 1))
 
-def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
+    for piece, end_seconds in backend.transcribe_segments(audio):
+        if piece:
+            pieces.append(piece)
+        report(end_seconds)
+    
+    text = " ".join(pieces)
+    if not text:
+        raise TranscriptionError("No speech recognised")
+    return text
+
+
+def _keywords_from_doc(doc, max_keywords: int) -> List[str]:
+    # Extract important words (nouns, proper nouns, verbs); dicts keep first-seen order
+    words = dict.fromkeys(
+        # Use lemma (base form) for consistency
+        token.lemma_.lower() for token in doc
+        # Skip stopwords, punctuation, and short words
+        if not (token.is_stop or token.is_punct or len(token.text) < 3)
+        and token.pos_ in KEYWORD_POS
+    )
+    # Also extract named entities (locations, organizations, etc.), ahead of the words
+    entities = dict.fromkeys(ent.text.lower() for ent in doc.ents if ent.label_ in KEYWORD_ENTITIES)
+    keywords = [e for e in reversed(list(entities)) if e not in words] + list(words)
+    return keywords[:max_keywords]
+
+
+def extract_keywords_batch(texts: List[str], max_keywords: int = 10) -> List[List[str]]:
     """
-    Extract keywords from text using spaCy.
-    Focuses on nouns, proper nouns, and verbs.
+    Extract keywords from several transcripts with one nlp.pipe pass.
+    Focuses on nouns, proper nouns, verbs and named entities.
     
     Args:
-        text: Input text
-        max_keywords: Maximum number of keywords to return
+        texts: Input texts (empty ones yield no keywords)
+        max_keywords: Maximum number of keywords per text
         
     Returns:
-        List of keywords
+        One list of keywords per text
     """
-    if not text:
-        return []
+    if not any(texts):
+        return [[] for _ in texts]
     
     try:
         nlp = get_spacy_model()
-        doc = nlp(text)
-        
-        # Extract important words (nouns, proper nouns, verbs)
-        keywords = []
-        for token in doc:
-            # Skip stopwords, punctuation, and short words
-            if token.is_stop or token.is_punct or len(token.text) < 3:
-                continue
-            
-            # Focus on meaningful parts of speech
-            if token.pos_ in ['NOUN', 'PROPN', 'VERB', 'ADJ']:
-                # Use lemma (base form) for consistency
-                word = token.lemma_.lower()
-                if word not in keywords:
-                    keywords.append(word)
-        
-        # Also extract named entities (locations, organizations, etc.)
-        for ent in doc.ents:
-            if ent.label_ in ['GPE', 'LOC', 'ORG', 'PERSON', 'EVENT']:
-                ent_text = ent.text.lower()
-                if ent_text not in keywords:
-                    keywords.insert(0, ent_text)  # Prioritize entities
-        
-        return keywords[:max_keywords]
+        docs = nlp.pipe((text or "" for text in texts), batch_size=KEYWORD_BATCH_SIZE)
+        return [_keywords_from_doc(doc, max_keywords) for doc in docs]
     except Exception as e:
         logger.error(f"Keyword extraction error: {e}")
-        return []
+        return [[] for _ in texts]
+
+
+def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
+    """Extract keywords from a single text (see extract_keywords_batch)"""
+    return extract_keywords_batch([text], max_keywords)[0]
 
 
-def process_transcription_background(alert_id: int, audio_path: str, db_session_factory):
+def _report_partial(alert_id: int):
+    def report(text: str, done: float, total: float):
+        if _progress_queue is not None:
+            _progress_queue.put((alert_id, text, done, total))
+    return report
+
+
+def transcribe_clip(alert_id: int, audio_path: str) -> dict:
     """
-    Background task to transcribe audio and extract keywords.
-    Updates the database with results.
-    
-    Args:
-        alert_id: ID of the alert to update
-        audio_path: Path to audio file
-        db_session_factory: Function to create database session
+    Transcribe one clip in a worker process, reporting partial transcripts on
+    the progress queue as text arrives. Returns {"transcription"} or
+    {"error", "retry"}; keywords are extracted separately, in batches.
     """
-    def _process():
-        logger.info(f"Starting transcription for alert {alert_id}")
-        
-        # Create new session for background thread
-        db = db_session_factory()
-        
-        try:
-            from .models import Alert
-            alert = db.query(Alert).filter(Alert.id == alert_id).first()
-            
-            if not alert:
-                logger.error(f"Alert {alert_id} not found")
-                return
-            
-            # Transcribe
-            transcription = transcribe_audio(audio_path)
-            
-            if transcription:
-                # Extract keywords
-                keywords = extract_keywords(transcription)
-                
-                # Update alert
-                alert.transcription = transcription
-                alert.transcription_keywords = ", ".join(keywords) if keywords else None
-                alert.transcription_status = 'completed'
-                
-                logger.info(f"Transcription completed for alert {alert_id}: {len(transcription)} chars, {len(keywords)} keywords")
-            else:
-                alert.transcription_status = 'failed'
-                logger.error(f"Transcription failed for alert {alert_id}")
-            
-            db.commit()
-        except Exception as e:
-            logger.error(f"Background transcription error for alert {alert_id}: {e}")
+    try:
+        return {"transcription": transcribe_audio(audio_path, on_partial=_report_partial(alert_id))}
+    except TranscriptionError as e:
+        # Missing or unreadable audio will not get better on retry
+        return {"error": str(e), "retry": False}
+    except Exception as e:
+        # Only plain values cross the process boundary
+        return {"error": str(e) or type(e).__name__, "retry": True}
+
+
+# --- Worker process pool ---
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 1
+# Serialises replacing a broken pool between the worker threads
+_pool_lock = threading.Lock()
+# (alert_id, text so far, seconds transcribed, total seconds) from the workers to the API process
+_progress_queue = None
+
+
+def _warm_up_worker(progress_queue):
+    """Pool initializer: load both models and run them once before taking jobs"""
+    global _progress_queue
+    _progress_queue = progress_queue
+    backend = get_transcription_backend()
+    # One second of low noise; the output is discarded
+    clip = (np.random.default_rng(0).standard_normal(SAMPLE_RATE) * 0.01).astype(np.float32)
+    backend.transcribe(clip)
+    extract_keywords_batch(["Warm up the keyword model near the main market."])
+    logger.info(f"Transcription worker {os.getpid()} ready")
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+def start_pool(processes: int):
+    """Start the worker processes and begin warming them up in the background"""
+    global _pool, _pool_size, _progress_queue
+    context = multiprocessing.get_context("spawn")
+    if _progress_queue is None:
+        _progress_queue = context.Queue()
+    _pool_size = processes
+    _pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=context,
+        initializer=_warm_up_worker,
+        initargs=(_progress_queue,)
+    )
+    # Processes are spawned on demand; submit one no-op per slot so all of
+    # them start loading models now rather than on the first voice alert
+    for _ in range(processes):
+        _pool.submit(_ready)
+
+
+def stop_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def progress_queue():
+    """Queue of partial transcripts reported by the worker processes"""
+    return _progress_queue
+
+
+def _run_in_pool(fn, *args, on_wait: Optional[Callable[[], None]] = None, wait_seconds: float = 60.0):
+    """Run fn in a worker process and wait for the result, calling on_wait every wait_seconds meanwhile"""
+    pool = _pool
+    try:
+        future = pool.submit(fn, *args)
+        while True:
             try:
-                from .models import Alert
-                alert = db.query(Alert).filter(Alert.id == alert_id).first()
-                if alert:
-                    alert.transcription_status = 'failed'
-                    db.commit()
-            except:
-                pass
-        finally:
-            db.close()
-    
-    # Run in background thread
-    thread = threading.Thread(target=_process, daemon=True)
-    thread.start()
-    logger.info(f"Background transcription thread started for alert {alert_id}")
+                return future.result(timeout=wait_seconds)
+            except FutureTimeoutError:
+                if on_wait is not None:
+                    on_wait()
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); replace the pool, the jobs are retried
+        with _pool_lock:
+            # Every thread waiting on the broken pool gets here; only the first replaces it
+            if _pool is pool:
+                logger.error("Transcription worker pool broke; restarting it")
+                stop_pool()
+                start_pool(_pool_size)
+        raise
 
 
-def start_transcription(alert_id: int, audio_path: str, db_session_factory):
-    """
-    Entry point to start transcription process.
-    Sets status to pending and launches background task.
-    """
-    process_transcription_background(alert_id, audio_path, db_session_factory)
+def transcribe_in_pool(alert_id: int, audio_path: str, on_wait: Optional[Callable[[], None]] = None,
+                       wait_seconds: float = 60.0) -> dict:
+    """Run transcribe_clip in a worker process and wait for the result"""
+    return _run_in_pool(transcribe_clip, alert_id, audio_path, on_wait=on_wait, wait_seconds=wait_seconds)
+
+
+def extract_keywords_in_pool(texts: List[str], on_wait: Optional[Callable[[], None]] = None,
+                             wait_seconds: float = 60.0) -> List[List[str]]:
+    """Run extract_keywords_batch in a worker process and wait for the result"""
+    return _run_in_pool(extract_keywords_batch, texts, on_wait=on_wait, wait_seconds=wait_seconds)
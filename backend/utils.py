@@ -1,12 +1,14 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+from sqlalchemy import or_
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, List
 from jose import JWTError, jwt
 import os
 import math
+import numpy as np
 from . import models
 from . import database
 
@@ -32,13 +34,181 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+EARTH_RADIUS_KM = 6371.0
+
 def calculate_distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371
+    R = EARTH_RADIUS_KM
     lat1_rad, lat2_rad = math.radians(lat1), math.radians(lat2)
     delta_lat, delta_lon = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
     a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
     return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
 
+def haversine_many(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Distances in km from one origin to arrays of points, in a single vectorized pass"""
+    lats_rad = np.radians(np.asarray(lats, dtype=np.float64))
+    lons_rad = np.radians(np.asarray(lons, dtype=np.float64))
+    lat_rad, lon_rad = math.radians(lat), math.radians(lon)
+    a = np.sin((lats_rad - lat_rad) / 2) ** 2 + math.cos(lat_rad) * np.cos(lats_rad) * np.sin((lons_rad - lon_rad) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_matrix(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """Pairwise distance matrix in km, shape (len(lats1), len(lats2)), e.g. alerts x officers"""
+    lats1_rad = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lons1_rad = np.radians(np.asarray(lons1, dtype=np.float64))[:, None]
+    lats2_rad = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lons2_rad = np.radians(np.asarray(lons2, dtype=np.float64))[None, :]
+    a = np.sin((lats2_rad - lats1_rad) / 2) ** 2 + np.cos(lats1_rad) * np.cos(lats2_rad) * np.sin((lons2_rad - lons1_rad) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def within_radius(lat: float, lon: float, lats, lons, radius_km: float):
+    """Indices of points within radius_km of the origin (sorted nearest first) and their distances"""
+    distances = haversine_many(lat, lon, lats, lons)
+    idx = np.flatnonzero(distances <= radius_km)
+    idx = idx[np.argsort(distances[idx], kind="stable")]
+    return idx, distances[idx]
+
+def nearest_k(lat: float, lon: float, lats, lons, k: int, radius_km: Optional[float] = None):
+    """Indices of the k points nearest to the origin (sorted nearest first) and their distances"""
+    distances = haversine_many(lat, lon, lats, lons)
+    if radius_km is not None:
+        candidates = np.flatnonzero(distances <= radius_km)
+    else:
+        candidates = np.arange(len(distances))
+    if k < len(candidates):
+        candidates = candidates[np.argpartition(distances[candidates], k)[:k]]
+    idx = candidates[np.argsort(distances[candidates], kind="stable")]
+    return idx, distances[idx]
+
+def simplify_track(lats, lons, tolerance_m: float) -> np.ndarray:
+    """
+    Douglas-Peucker simplification of a GPS track. Returns the indices of the
+    points to keep (always including both ends) so that no dropped point lies
+    further than tolerance_m from the simplified line. Points are projected to
+    local metres around the track's mean latitude, which is accurate for walks.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    if n <= 2 or tolerance_m <= 0:
+        return np.arange(n)
+    metres_per_degree = EARTH_RADIUS_KM * 1000 * math.pi / 180
+    x = lons * metres_per_degree * math.cos(math.radians(float(lats.mean())))
+    y = lats * metres_per_degree
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        # Distance to the segment rather than the infinite line, so a walk
+        # that doubles back past its own endpoint keeps the turning point
+        length_sq = dx * dx + dy * dy
+        t = np.clip((px * dx + py * dy) / length_sq, 0.0, 1.0) if length_sq else 0.0
+        distances = np.hypot(px - t * dx, py - t * dy)
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance_m:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+# Geohash grid used to bucket alerts (and later officers) into B-tree indexable cells
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 7  # ~150m cells, stored on indexed columns
+
+# Approximate cell size (width at the equator, height) in km for each precision
+_GEOHASH_CELL_KM = {
+    1: (5009.4, 4992.6), 2: (1252.3, 624.1), 3: (156.5, 156.0), 4: (39.1, 19.5),
+    5: (4.89, 4.87), 6: (1.22, 0.61), 7: (0.153, 0.152),
+}
+
+def geohash_encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+def geo_cell_for(latitude: Optional[float], longitude: Optional[float]) -> Optional[str]:
+    """Geohash cell stored on rows with an optional location"""
+    if latitude is None or longitude is None:
+        return None
+    return geohash_encode(latitude, longitude)
+
+def geohash_bounds(cell: str):
+    """Return (min_lat, min_lon, max_lat, max_lon) of a geohash cell"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+def geohash_neighbors(cell: str) -> List[str]:
+    """Return the cell itself plus its 8 surrounding cells of the same precision"""
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(cell)
+    lat_step, lon_step = max_lat - min_lat, max_lon - min_lon
+    center_lat, center_lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+    cells = []
+    for dlat in (-1, 0, 1):
+        lat = center_lat + dlat * lat_step
+        if lat < -90 or lat > 90:
+            continue
+        for dlon in (-1, 0, 1):
+            lon = (center_lon + dlon * lon_step + 180) % 360 - 180
+            neighbor = geohash_encode(lat, lon, len(cell))
+            if neighbor not in cells:
+                cells.append(neighbor)
+    return cells
+
+def geohash_precision_for_radius(radius_km: float, latitude: float = 0.0) -> int:
+    """Finest precision whose cells are at least radius_km wide and tall at this latitude,
+    so the 3x3 neighbourhood around a point covers the whole search circle."""
+    shrink = max(math.cos(math.radians(latitude)), 0.01)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        width, height = _GEOHASH_CELL_KM[precision]
+        if width * shrink >= radius_km and height >= radius_km:
+            return precision
+    return 1
+
+def geohash_cover(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    """Coarse geohash prefixes whose union covers a circle around (latitude, longitude)"""
+    precision = geohash_precision_for_radius(radius_km, latitude)
+    return geohash_neighbors(geohash_encode(latitude, longitude, precision))
+
+def geohash_prefix_filter(column, prefixes: List[str]):
+    """SQL filter matching rows whose full-precision geohash starts with any prefix.
+    Expressed as range predicates so the B-tree index on the column is used."""
+    pad = GEOHASH_PRECISION
+    return or_(*[
+        column.between(prefix.ljust(pad, GEOHASH_ALPHABET[0]), prefix.ljust(pad, GEOHASH_ALPHABET[-1]))
+        for prefix in prefixes
+    ])
+
 def mask_cnic(cnic: str) -> str:
     """Mask CNIC showing only last 4 digits"""
     if cnic and len(cnic) >= 4:
@@ -95,3 +265,8 @@ def get_police_user(current_user: models.User = Depends(get_approved_user)):
     if current_user.user_type != 'police':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Police officer access required")
     return current_user
+
+def get_police_or_admin_user(current_user: models.User = Depends(get_approved_user)):
+    if current_user.user_type not in ('police', 'admin'):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Police or admin access required")
+    return current_user
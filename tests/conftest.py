@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import models
+
+
+@pytest.fixture
+def session_factory():
+    """Sessions on a fresh in-memory SQLite database with the full schema"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    """A session whose executed SQL is recorded in db.statements"""
+    session = session_factory()
+    session.statements = []
+
+    @event.listens_for(session_factory.kw["bind"], "before_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        session.statements.append(statement)
+
+    yield session
+    session.close()
@@ -0,0 +1,210 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy.dialects import postgresql
+
+from backend import alert_index, models, pagination, utils
+from backend.routers import alerts
+
+
+def seed_alerts(db, count):
+    citizen = models.User(cnic="1111111111111", password_hash="x", user_type="citizen", full_name="Citizen")
+    officer = models.User(cnic="2222222222222", password_hash="x", user_type="police",
+                          full_name="Officer", police_badge_number="B-1", phone="03000000000")
+    db.add_all([citizen, officer])
+    db.flush()
+    for i in range(count):
+        alert = models.Alert(user_id=citizen.id, alert_type="sos", content=f"alert {i}", status="pending")
+        if i % 2:
+            alert.status = "responded"
+            alert.responded_by = officer.id
+        db.add(alert)
+        db.flush()
+        if i % 3 == 0:
+            db.add(models.ChatMessage(alert_id=alert.id, sender_id=officer.id,
+                                      receiver_id=citizen.id, message="on the way"))
+    db.commit()
+    citizen_id = citizen.id
+    db.expunge_all()
+    return db.query(models.User).filter(models.User.id == citizen_id).one()
+
+
+@pytest.mark.parametrize("count", [2, 20, 200])
+def test_get_alerts_uses_fixed_query_budget(db, count):
+    citizen = seed_alerts(db, count)
+    db.statements.clear()
+
+    result = alerts.get_alerts(response=Response(), cursor=None, limit=500, current_user=citizen, db=db)
+
+    assert len(result) == count
+    assert len(db.statements) == 1
+    by_content = {a["content"]: a for a in result}
+    assert by_content["alert 0"]["has_chat"] is True
+    assert by_content["alert 1"]["has_chat"] is False
+    assert by_content["alert 1"]["responding_officer"]["badge_number"] == "B-1"
+    assert by_content["alert 0"]["responding_officer"] is None
+
+
+@pytest.mark.parametrize("count", [2, 40])
+def test_police_history_uses_fixed_query_budget(db, count):
+    citizen = seed_alerts(db, count)
+    officer = db.query(models.User).filter(models.User.user_type == "police").one()
+    start = datetime(2026, 1, 1)
+    for alert in db.query(models.Alert).all():
+        db.add(models.AlertResponse(alert_id=alert.id, officer_id=officer.id,
+                                    response_time=start + timedelta(minutes=alert.id // 2)))
+    db.commit()
+    db.refresh(officer)
+    db.statements.clear()
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        response = Response()
+        page = alerts.get_police_history(response=response, cursor=cursor, limit=15, current_user=officer, db=db)
+        seen.extend(page)
+        pages += 1
+        cursor = response.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+
+    assert len(db.statements) == pages
+    assert len({row["id"] for row in seen}) == count
+    assert all(row["citizen_name"] == "Citizen" for row in seen)
+    assert [row["response_time"] for row in seen] == sorted((row["response_time"] for row in seen), reverse=True)
+
+
+def test_nearby_feed_loads_senders_without_extra_queries(db):
+    citizen = seed_alerts(db, 0)
+    officer = db.query(models.User).filter(models.User.user_type == "police").one()
+    for i in range(30):
+        lat, lon = 33.68 + i * 0.001, 73.04
+        db.add(models.Alert(user_id=citizen.id, alert_type="sos", status="pending",
+                            latitude=lat, longitude=lon, geo_cell=utils.geo_cell_for(lat, lon)))
+    db.commit()
+    db.refresh(officer)
+    db.statements.clear()
+
+    result = alerts.get_nearby_alerts(latitude=33.68, longitude=73.04, response=Response(), radius_km=10, cursor=None, limit=50,
+                                      current_user=officer, db=db)
+
+    assert len(result) == 30
+    assert len(db.statements) == 2
+    assert all(a["sender"]["cnic_masked"].endswith("1111") for a in result)
+    assert "password_hash" not in db.statements[0]
+
+
+def test_nearby_feed_is_served_from_live_index(db):
+    citizen = seed_alerts(db, 0)
+    officer = db.query(models.User).filter(models.User.user_type == "police").one()
+    for i in range(10):
+        lat, lon = 33.68 + i * 0.01, 73.04
+        db.add(models.Alert(user_id=citizen.id, alert_type="sos", status="pending",
+                            latitude=lat, longitude=lon, geo_cell=utils.geo_cell_for(lat, lon)))
+    db.add(models.Alert(user_id=citizen.id, alert_type="sos", status="responded", responded_by=officer.id,
+                        latitude=35.0, longitude=75.0, geo_cell=utils.geo_cell_for(35.0, 75.0)))
+    db.commit()
+    db.refresh(officer)
+    alert_index.pending_alerts.replace_all(
+        [alert_index.snapshot(a) for a in alert_index.open_alerts_query(db)]
+    )
+    db.statements.clear()
+    try:
+        result = alerts.get_nearby_alerts(latitude=33.68, longitude=73.04, response=Response(), radius_km=5,
+                                          cursor=None, limit=50, current_user=officer, db=db)
+    finally:
+        alert_index.pending_alerts.replace_all([])
+        alert_index.pending_alerts.ready = False
+
+    assert db.statements == []
+    assert [a["status"] for a in result].count("pending") == 5
+    assert result[-1]["status"] == "responded"
+    assert [a["distance_km"] for a in result[:5]] == sorted(a["distance_km"] for a in result[:5])
+
+
+def test_search_filters_by_tag_status_time_and_box(db):
+    citizen = seed_alerts(db, 0)
+    officer = db.query(models.User).filter(models.User.user_type == "police").one()
+    for i in range(6):
+        db.add(models.Alert(user_id=citizen.id, alert_type="sos", content=f"alert {i}",
+                            tag="fire" if i % 2 else "police", status="pending",
+                            latitude=31.5 if i < 3 else 24.8, longitude=74.3 if i < 3 else 67.0))
+    db.commit()
+    db.refresh(officer)
+
+    def search(**filters):
+        params = dict(q=None, tag=None, alert_status=None, created_after=None, created_before=None,
+                      min_lat=None, max_lat=None, min_lon=None, max_lon=None, cursor=None, limit=100)
+        params.update(filters)
+        return [a["content"] for a in alerts.search_alerts(response=Response(), current_user=officer, db=db, **params)]
+
+    assert search(tag="FIRE") == ["alert 5", "alert 3", "alert 1"]
+    assert search(tag="fire", min_lat=30, max_lat=32, min_lon=73, max_lon=75) == ["alert 1"]
+    assert search(alert_status="resolved") == []
+
+    with pytest.raises(HTTPException):
+        search(min_lat=30, max_lat=32)
+
+
+def test_nearby_pages_start_with_the_nearest_alerts(db):
+    citizen = seed_alerts(db, 0)
+    officer = db.query(models.User).filter(models.User.user_type == "police").one()
+    # The nearest alert is the oldest, so a newest-first page would drop it
+    for i in range(12):
+        lat, lon = 33.68 + i * 0.002, 73.04
+        db.add(models.Alert(user_id=citizen.id, alert_type="sos", status="pending", content=f"alert {i}",
+                            latitude=lat, longitude=lon, geo_cell=utils.geo_cell_for(lat, lon)))
+        db.flush()
+    db.commit()
+    db.refresh(officer)
+
+    response = Response()
+    first = alerts.get_nearby_alerts(latitude=33.68, longitude=73.04, response=response, radius_km=10,
+                                     cursor=None, limit=5, current_user=officer, db=db)
+    cursor = response.headers["X-Next-Cursor"]
+    second = alerts.get_nearby_alerts(latitude=33.68, longitude=73.04, response=Response(), radius_km=10,
+                                      cursor=cursor, limit=50, current_user=officer, db=db)
+
+    assert [a["content"] for a in first] == [f"alert {i}" for i in range(5)]
+    assert [a["content"] for a in second] == [f"alert {i}" for i in range(5, 12)]
+
+
+def test_search_query_matches_text_with_a_tsquery(db, monkeypatch):
+    seed_alerts(db, 0)
+    officer = db.query(models.User).filter(models.User.user_type == "police").one()
+    captured = []
+    monkeypatch.setattr(alerts.pagination, "paginate_query",
+                        lambda query, *args, **kwargs: captured.append(query) or ([], None))
+
+    alerts.search_alerts(response=Response(), q='"liberty market" -fire', tag="police", alert_status=None,
+                         created_after=None, created_before=None, min_lat=None, max_lat=None,
+                         min_lon=None, max_lon=None, cursor=None, limit=10, current_user=officer, db=db)
+
+    compiled = captured[0].statement.compile(dialect=postgresql.dialect())
+    assert "alerts.search_vector @@ websearch_to_tsquery(%(param_1)s, %(websearch_to_tsquery_1)s)" in str(compiled)
+    assert compiled.params["param_1"] == models.ALERT_SEARCH_CONFIG
+    assert compiled.params["websearch_to_tsquery_1"] == '"liberty market" -fire'
+    assert compiled.params["tag_1"] == "police"
+
+
+def test_changes_during_a_rebuild_are_not_lost():
+    index = alert_index.PendingAlertIndex()
+
+    def entry(alert_id, status, responded_by=None):
+        return {"id": alert_id, "status": status, "geo_cell": "tt3mqr", "responded_by": responded_by}
+
+    index.replace_all([entry(1, "pending"), entry(2, "pending")])
+
+    def load():
+        # Read before these writes committed: the new SOS is missing and alert 2 still looks pending
+        index.upsert(entry(3, "pending"))
+        index.upsert(entry(2, "responded", responded_by=9))
+        index.remove(1)
+        return [entry(1, "pending"), entry(2, "pending")]
+
+    index.rebuild(load)
+
+    assert {a["id"] for a in index.pending_in_cells(["tt3m"])} == {3}
+    assert [a["id"] for a in index.responding(9)] == [2]
+    index.upsert(entry(4, "pending"))
+    assert index._journal is None and index.is_pending(4)
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from backend import alert_service
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    calls = []
+    monkeypatch.setattr(alert_service.alert_index, "alert_changed", lambda alert, sender=None: None)
+    monkeypatch.setattr(alert_service.dispatch, "start_dispatch",
+                        lambda data, lat, lon: calls.append((data["id"], threading.current_thread())))
+    monkeypatch.setattr(alert_service, "_loop", None)
+    monkeypatch.setattr(alert_service, "_early", [])
+    return calls
+
+
+def make_alert(alert_id):
+    alert = alert_service.build_alert(1, "sos", 33.68, 73.04, content="help")
+    alert.id, alert.created_at = alert_id, datetime.now(timezone.utc)
+    return alert
+
+
+def test_build_alert_sets_cell_and_transcription_status():
+    voice = alert_service.build_alert(1, "voice", 33.68, 73.04, audio_url="/audio/x.m4a")
+    assert voice.transcription_status == "pending"
+    assert voice.geo_cell.startswith("tt")
+    assert alert_service.build_alert(1, "sos", None, None).geo_cell is None
+
+
+def publish_from_thread(alert):
+    worker = threading.Thread(target=alert_service.publish, args=(alert,))
+    worker.start()
+    worker.join()
+
+
+def test_publish_from_threads_runs_dispatch_on_the_loop(dispatched):
+    async def scenario():
+        loop_thread = threading.current_thread()
+        # Published by a thread before the loop is bound (e.g. the monitor at startup)
+        publish_from_thread(make_alert(1))
+        assert len(alert_service._early) == 1 and not dispatched
+        alert_service.bind_loop(asyncio.get_running_loop())
+        publish_from_thread(make_alert(2))
+        alert_service.publish(make_alert(3))
+        await asyncio.sleep(0.05)
+        return loop_thread
+
+    loop_thread = asyncio.run(scenario())
+    assert sorted(alert_id for alert_id, _ in dispatched) == [1, 2, 3]
+    assert all(thread is loop_thread for _, thread in dispatched)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from backend import audio_preprocessing
+from backend.audio_preprocessing import SAMPLE_RATE
+
+
+def tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def hiss(seconds, amplitude=0.002):
+    return (np.random.default_rng(1).standard_normal(int(seconds * SAMPLE_RATE)) * amplitude).astype(np.float32)
+
+
+def test_leading_and_trailing_silence_is_trimmed_with_padding():
+    clip = np.concatenate([hiss(8), tone(2), hiss(0.5), tone(1), hiss(10)])
+    processed = audio_preprocessing.preprocess(clip)
+    seconds = len(processed) / SAMPLE_RATE
+    assert 3.5 <= seconds <= 3.5 + 2 * audio_preprocessing.PAD_MS / 1000 + 0.1
+    assert abs(np.abs(processed).max() - audio_preprocessing.PEAK_LEVEL) < 1e-3
+
+
+def test_silent_clip_is_empty_and_long_clip_is_capped(monkeypatch):
+    assert len(audio_preprocessing.preprocess(np.zeros(SAMPLE_RATE * 5, dtype=np.float32))) == 0
+
+    monkeypatch.setattr(audio_preprocessing, "MAX_SECONDS", 3)
+    assert len(audio_preprocessing.preprocess(tone(10))) == 3 * SAMPLE_RATE
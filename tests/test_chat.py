@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import Response
+
+from backend import models
+from backend.routers import chat
+
+
+def seed_chat(db, count):
+    """An alert with count messages, alternating officer -> citizen and citizen -> officer"""
+    citizen = models.User(cnic="1111111111111", password_hash="x", user_type="citizen", full_name="Citizen")
+    officer = models.User(cnic="2222222222222", password_hash="x", user_type="police", full_name="Officer")
+    db.add_all([citizen, officer])
+    db.flush()
+    alert = models.Alert(user_id=citizen.id, alert_type="sos", status="responded", responded_by=officer.id)
+    db.add(alert)
+    db.flush()
+    start = datetime(2026, 1, 1)
+    for i in range(count):
+        sender, receiver = (officer, citizen) if i % 2 == 0 else (citizen, officer)
+        db.add(models.ChatMessage(alert_id=alert.id, sender_id=sender.id, receiver_id=receiver.id,
+                                  message=f"message {i}", created_at=start + timedelta(seconds=i)))
+    db.commit()
+    db.refresh(citizen)
+    return alert.id, citizen
+
+
+def unread_for(db, user):
+    return {m.message for m in db.query(models.ChatMessage).filter(
+        models.ChatMessage.receiver_id == user.id, models.ChatMessage.read_at.is_(None))}
+
+
+@pytest.mark.parametrize("count", [2, 50])
+def test_chat_uses_fixed_query_budget(db, count):
+    alert_id, citizen = seed_chat(db, count)
+    db.statements.clear()
+
+    result = chat.get_chat_messages(alert_id, response=Response(), since_id=None, cursor=None, limit=500,
+                                    current_user=citizen, db=db)
+
+    assert len(result) == count
+    # Alert, messages, the other participant, one bulk read update
+    assert len(db.statements) == 4
+    assert {m["sender_name"] for m in result} == {"Citizen", "Officer"}
+    assert unread_for(db, citizen) == set()
+
+
+def test_only_returned_messages_are_marked_read(db):
+    alert_id, citizen = seed_chat(db, 10)
+    first_id = db.query(models.ChatMessage.id).order_by(models.ChatMessage.id).first()[0]
+
+    # Messages 0-3 were already seen; the page after them holds 4-7
+    result = chat.get_chat_messages(alert_id, response=Response(), since_id=first_id + 3, cursor=None, limit=4,
+                                    current_user=citizen, db=db)
+
+    assert [m["message"] for m in result] == [f"message {i}" for i in range(4, 8)]
+    # Citizen receives the even-numbered messages; 4 and 6 were returned
+    assert unread_for(db, citizen) == {"message 0", "message 2", "message 8"}
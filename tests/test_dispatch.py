@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from backend import dispatch, models
+
+# Officers are placed due north of the origin at the given distance
+ORIGIN = (33.70, 73.05)
+
+
+def at_km(km):
+    return ORIGIN[0] + km / 111.2, ORIGIN[1]
+
+
+def test_nearest_skips_stale_and_excluded_officers():
+    index = dispatch.OfficerLocationIndex()
+    now = datetime.now(timezone.utc)
+    index.update(1, *at_km(1), now)
+    index.update(2, *at_km(2), now)
+    index.update(3, *at_km(3), now - dispatch.OFFICER_ACTIVE_WINDOW - timedelta(minutes=1))
+    index.update(4, *at_km(4), now)
+    index.update(5, *at_km(20), now)
+
+    assert [officer for officer, _ in index.nearest(*ORIGIN, k=10, radius_km=5)] == [1, 2, 4]
+    assert [officer for officer, _ in index.nearest(*ORIGIN, k=2, radius_km=5)] == [1, 2]
+    assert [officer for officer, _ in index.nearest(*ORIGIN, k=10, radius_km=5, exclude={1})] == [2, 4]
+    assert [officer for officer, _ in index.nearest(*ORIGIN, k=10, radius_km=50)] == [1, 2, 4, 5]
+    distances = [d for _, d in index.nearest(*ORIGIN, k=10, radius_km=5)]
+    assert distances == pytest.approx([1, 2, 4], rel=0.01)
+
+
+class FakeSocket:
+    def __init__(self, on_emit=None):
+        self.rooms = []
+        self.on_emit = on_emit
+
+    async def emit(self, event, data, room=None):
+        self.rooms.append(room)
+        if self.on_emit:
+            self.on_emit(room)
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    index = dispatch.OfficerLocationIndex()
+    now = datetime.now(timezone.utc)
+    for officer_id, km in [(1, 1), (2, 2), (3, 10), (4, 30)]:
+        index.update(officer_id, *at_km(km), now)
+    monkeypatch.setattr(dispatch, "officer_locations", index)
+    monkeypatch.setattr(dispatch, "DISPATCH_STAGES", [(5.0, 5, 0), (15.0, 5, 0), (50.0, 5, 0)])
+    monkeypatch.setattr(dispatch, "GEO_ROOM_WAIT_SECONDS", 0)
+
+
+def test_unclaimed_alert_widens_to_geo_room_then_everyone(stages, monkeypatch):
+    socket = FakeSocket()
+    monkeypatch.setattr(dispatch, "sio", socket)
+    monkeypatch.setattr(dispatch, "pending_alerts", SimpleNamespace(ready=True, is_pending=lambda alert_id: True))
+
+    asyncio.run(dispatch.dispatch_alert({"id": 7}, *ORIGIN))
+
+    assert socket.rooms == ["user_1", "user_2", "user_3", "user_4",
+                            dispatch.geo_room_for(*ORIGIN), "police_all"]
+
+
+def test_widening_stops_once_the_alert_is_claimed(stages, monkeypatch, db, session_factory):
+    db.add(models.User(id=9, cnic="9999999999999", password_hash="x", user_type="citizen"))
+    db.add(models.Alert(id=7, user_id=9, alert_type="sos", status="pending"))
+    db.commit()
+    checked_on = []
+
+    def claim(room):
+        db.query(models.Alert).filter(models.Alert.id == 7).update({"status": "responded"})
+        db.commit()
+
+    def is_pending_in_db(alert_id):
+        checked_on.append(threading.current_thread())
+        return original(alert_id)
+
+    original = dispatch._is_pending_in_db
+    socket = FakeSocket(on_emit=claim)
+    monkeypatch.setattr(dispatch, "sio", socket)
+    monkeypatch.setattr(dispatch, "SessionLocal", session_factory)
+    # Index still loading, so the claim is read from the database
+    monkeypatch.setattr(dispatch, "pending_alerts", SimpleNamespace(ready=False))
+    monkeypatch.setattr(dispatch, "_is_pending_in_db", is_pending_in_db)
+
+    asyncio.run(dispatch.dispatch_alert({"id": 7}, *ORIGIN))
+
+    assert socket.rooms == ["user_1", "user_2"]
+    assert checked_on and threading.main_thread() not in checked_on
+
+
+def test_officers_no_longer_eligible_are_disconnected(db, session_factory, monkeypatch):
+    db.add_all([
+        models.User(id=1, cnic="1000000000001", password_hash="x", user_type="police", approval_status="approved"),
+        models.User(id=2, cnic="1000000000002", password_hash="x", user_type="police", approval_status="approved",
+                    account_status="suspended"),
+        models.User(id=3, cnic="1000000000003", password_hash="x", user_type="police", approval_status="rejected"),
+    ])
+    db.commit()
+    index = dispatch.OfficerLocationIndex()
+    for officer_id in (1, 2, 3):
+        index.update(officer_id, *ORIGIN, datetime.now(timezone.utc))
+    disconnected = []
+
+    async def disconnect_officer(officer_id):
+        disconnected.append(officer_id)
+
+    monkeypatch.setattr(dispatch, "SessionLocal", session_factory)
+    monkeypatch.setattr(dispatch, "officer_locations", index)
+    monkeypatch.setattr(dispatch, "local_officer_ids", lambda: {1, 2, 3})
+    monkeypatch.setattr(dispatch, "disconnect_officer", disconnect_officer)
+
+    asyncio.run(dispatch.drop_ineligible_officers())
+
+    assert sorted(disconnected) == [2, 3]
+    assert [officer for officer, _ in index.nearest(*ORIGIN, k=10, radius_km=5)] == [1]
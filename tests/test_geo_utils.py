@@ -0,0 +1,55 @@
+import numpy as np
+
+from backend import utils
+
+ISLAMABAD = (33.6844, 73.0479)
+
+
+def test_haversine_many_matches_scalar():
+    lats = np.random.uniform(33.0, 34.5, 500)
+    lons = np.random.uniform(72.0, 74.0, 500)
+    batch = utils.haversine_many(*ISLAMABAD, lats, lons)
+    for i in range(0, 500, 50):
+        assert abs(batch[i] - utils.calculate_distance_km(*ISLAMABAD, lats[i], lons[i])) < 1e-9
+
+
+def test_haversine_matrix_shape_and_values():
+    lats = np.array([33.6, 33.7, 33.8])
+    lons = np.array([73.0, 73.1, 73.2])
+    matrix = utils.haversine_matrix(lats, lons, lats[:2], lons[:2])
+    assert matrix.shape == (3, 2)
+    assert matrix[0, 0] == 0
+    assert abs(matrix[2, 1] - utils.calculate_distance_km(33.8, 73.2, 33.7, 73.1)) < 1e-9
+
+
+def test_nearest_k_and_within_radius_are_sorted():
+    lats = np.array([33.70, 34.50, 33.69, 33.80])
+    lons = np.array([73.05, 73.05, 73.05, 73.05])
+    idx, distances = utils.nearest_k(*ISLAMABAD, lats, lons, 2)
+    assert idx.tolist() == [2, 0]
+    assert np.all(np.diff(distances) >= 0)
+
+    idx, distances = utils.within_radius(*ISLAMABAD, lats, lons, 20)
+    assert idx.tolist() == [2, 0, 3]
+    assert np.all(distances <= 20)
+
+
+def test_geohash_cover_contains_points_within_radius():
+    radius_km = 10
+    cover = utils.geohash_cover(*ISLAMABAD, radius_km)
+    for bearing in np.linspace(0, 2 * np.pi, 16, endpoint=False):
+        lat = ISLAMABAD[0] + (radius_km * 0.99 / 111.0) * np.cos(bearing)
+        lon = ISLAMABAD[1] + (radius_km * 0.99 / (111.0 * np.cos(np.radians(ISLAMABAD[0])))) * np.sin(bearing)
+        cell = utils.geohash_encode(lat, lon)
+        assert any(cell.startswith(prefix) for prefix in cover)
+
+
+def test_simplify_track_keeps_corners_and_drops_noise():
+    # Straight 1km north leg with ~1m jitter, then a sharp turn east
+    lats = list(33.68 + np.linspace(0, 0.009, 50)) + list(np.full(50, 33.689))
+    lons = list(73.04 + np.random.uniform(-1e-5, 1e-5, 50)) + list(73.04 + np.linspace(0, 0.01, 50))
+    keep = utils.simplify_track(lats, lons, tolerance_m=10)
+    assert keep[0] == 0 and keep[-1] == 99
+    assert len(keep) <= 6
+    assert any(abs(lats[i] - 33.689) < 1e-4 and abs(lons[i] - 73.04) < 1e-3 for i in keep)
+    assert utils.simplify_track(lats, lons, tolerance_m=0).tolist() == list(range(100))
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import location_buffer
+
+
+@pytest.fixture
+def buffer(session_factory, monkeypatch):
+    monkeypatch.setattr(location_buffer, "SessionLocal", session_factory)
+    return location_buffer.LocationBuffer()
+
+
+def recording(batches, during=None):
+    def bulk_update(db, items):
+        batches.append(dict(items))
+        if during:
+            during()
+    return bulk_update
+
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def test_pings_coalesce_and_out_of_order_fixes_are_dropped(buffer, monkeypatch):
+    batches = []
+    monkeypatch.setattr(location_buffer, "_bulk_update", recording(batches))
+    buffer.record(1, 33.0, 73.0, T0)
+    buffer.record(1, 33.1, 73.1, T0 + timedelta(seconds=5))
+    buffer.record(1, 32.0, 72.0, T0 + timedelta(seconds=2))  # arrived late
+    buffer.record(2, 34.0, 74.0, T0)
+
+    assert buffer.flush() == 2
+    assert batches == [{1: (33.1, 73.1, T0 + timedelta(seconds=5)), 2: (34.0, 74.0, T0)}]
+    assert buffer.flush() == 0
+
+
+def test_flushed_fixes_are_pruned_but_newer_ones_kept(buffer, monkeypatch):
+    batches = []
+    newer = (33.2, 73.2, T0 + timedelta(seconds=10))
+    monkeypatch.setattr(location_buffer, "_bulk_update",
+                        recording(batches, during=lambda: buffer.record(1, *newer)))
+    buffer.record(1, 33.0, 73.0, T0)
+    buffer.record(2, 34.0, 74.0, T0)
+
+    buffer.flush()
+
+    # User 2 now reads users.last_*; user 1's newer fix is still unflushed
+    assert buffer.latest(2) is None
+    assert buffer.latest(1) == newer
+    monkeypatch.setattr(location_buffer, "_bulk_update", recording(batches))
+    assert buffer.flush() == 1 and batches[-1] == {1: newer}
+
+
+def test_failed_flush_puts_fixes_back_without_overwriting_newer_ones(buffer, monkeypatch):
+    newer = (33.2, 73.2, T0 + timedelta(seconds=10))
+
+    def failing(db, items):
+        buffer.record(1, *newer)
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(location_buffer, "_bulk_update", failing)
+    buffer.record(1, 33.0, 73.0, T0)
+    buffer.record(2, 34.0, 74.0, T0)
+
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+
+    batches = []
+    monkeypatch.setattr(location_buffer, "_bulk_update", recording(batches))
+    assert buffer.flush() == 2
+    assert batches == [{1: newer, 2: (34.0, 74.0, T0)}]
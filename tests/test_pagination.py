@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from backend import models, pagination
+
+
+def test_cursor_round_trip():
+    key = (datetime(2026, 1, 2, 3, 4, 5), 42)
+    assert pagination.decode_cursor(pagination.encode_cursor(key)) == key
+    distance_key = (1.2345678901234, 7)
+    assert pagination.decode_cursor(pagination.encode_cursor(distance_key)) == distance_key
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(HTTPException) as exc:
+        pagination.decode_cursor("not-a-cursor")
+    assert exc.value.status_code == 400
+
+
+def test_distance_cursor_is_rejected_by_time_ordered_lists(db):
+    with pytest.raises(HTTPException) as exc:
+        pagination.paginate_query(
+            db.query(models.User), models.User.created_at, models.User.id, key=lambda u: (u.created_at, u.id),
+            cursor=pagination.encode_cursor((1.5, 7)), limit=5
+        )
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_query_pages_cover_every_row_once(db, descending):
+    start = datetime(2026, 1, 1)
+    for i in range(23):
+        # Repeated timestamps exercise the id tie-breaker
+        db.add(models.User(cnic=f"{i:013d}", password_hash="x", created_at=start + timedelta(minutes=i // 3)))
+    db.commit()
+
+    seen, cursor = [], None
+    while True:
+        users, cursor = pagination.paginate_query(
+            db.query(models.User), models.User.created_at, models.User.id,
+            key=lambda u: (u.created_at, u.id), cursor=cursor, limit=5, descending=descending
+        )
+        seen.extend(u.id for u in users)
+        if cursor is None:
+            break
+
+    assert len(seen) == 23 == len(set(seen))
+    expected = sorted(seen, key=lambda i: ((i - 1) // 3, i), reverse=descending)
+    assert seen == expected
+
+
+def test_list_pages_match_query_contract():
+    items = [(datetime(2026, 1, 1) + timedelta(minutes=i % 4), i) for i in range(10)]
+    page, cursor = pagination.paginate_list(items, key=lambda item: item, cursor=None, limit=4)
+    rest, last_cursor = pagination.paginate_list(items, key=lambda item: item, cursor=cursor, limit=10)
+    assert len(page) == 4 and len(rest) == 6 and last_cursor is None
+    assert not set(page) & set(rest)
@@ -0,0 +1,29 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from backend.safewalk_monitor import DeadlineScheduler
+
+
+def test_due_sessions_fire_in_deadline_order():
+    scheduler = DeadlineScheduler()
+    now = datetime.now(timezone.utc)
+    scheduler.schedule(1, now + timedelta(seconds=0.2))
+    scheduler.schedule(2, now - timedelta(seconds=1))
+    scheduler.schedule(3, now + timedelta(hours=1))
+
+    assert scheduler.wait_due(timeout=1) == [2]
+    started = time.monotonic()
+    assert scheduler.wait_due(timeout=1) == [1]
+    assert time.monotonic() - started < 0.5
+    assert scheduler.wait_due(timeout=0.05) == []
+
+
+def test_cancelled_and_rescheduled_sessions_do_not_fire_early():
+    scheduler = DeadlineScheduler()
+    now = datetime.now(timezone.utc)
+    scheduler.schedule(1, now - timedelta(seconds=1))
+    scheduler.cancel(1)
+    scheduler.schedule(2, now - timedelta(seconds=1))
+    scheduler.schedule(2, now + timedelta(hours=1))
+
+    assert scheduler.wait_due(timeout=0.05) == []
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from backend import models
+from backend.routers import safewalk
+
+
+def add_user(db, cnic, user_type):
+    user = models.User(cnic=cnic, password_hash="x", user_type=user_type, approval_status="approved")
+    db.add(user)
+    db.flush()
+    return user
+
+
+def test_only_walker_admin_and_responding_officer_see_the_trail(db):
+    walker = add_user(db, "1111111111111", "citizen")
+    responder = add_user(db, "2222222222222", "police")
+    other_officer = add_user(db, "3333333333333", "police")
+    admin = add_user(db, "4444444444444", "admin")
+    session = models.SafeWalkSession(user_id=walker.id, status="emergency_triggered",
+                                     end_time=datetime.now(timezone.utc) + timedelta(minutes=5))
+    db.add(session)
+    db.flush()
+    db.add(models.SafeWalkPoint(session_id=session.id, latitude=33.68, longitude=73.04,
+                                recorded_at=datetime.now(timezone.utc)))
+    alert = models.Alert(user_id=walker.id, alert_type="sos", status="responded", responded_by=responder.id,
+                         safe_walk_session_id=session.id)
+    db.add(alert)
+    db.flush()
+    db.add(models.AlertResponse(alert_id=alert.id, officer_id=responder.id, status="en_route"))
+    db.commit()
+
+    for user in (walker, admin, responder):
+        track = safewalk.get_track(session.id, tolerance_m=0, current_user=user, db=db)
+        assert track["total_points"] == 1
+
+    with pytest.raises(HTTPException) as exc:
+        safewalk.get_track(session.id, tolerance_m=0, current_user=other_officer, db=db)
+    assert exc.value.status_code == 403
@@ -0,0 +1,287 @@
+import queue
+
+import numpy as np
+import pytest
+
+from backend import audio_preprocessing, models, transcription_backends, transcription_queue
+from backend.transcription_backends import TranscriptionBackend
+
+
+@pytest.fixture(autouse=True)
+def queue_db(db, session_factory, monkeypatch):
+    monkeypatch.setattr(transcription_queue, "SessionLocal", session_factory)
+    monkeypatch.setattr(transcription_queue.alert_index, "alert_changed", lambda alert, sender=None: None)
+    monkeypatch.setattr(transcription_queue, "_keyword_queue", queue.Queue())
+    monkeypatch.setattr(transcription_queue, "extract_keywords_in_pool",
+                        lambda texts, **kwargs: [text.split()[-1:] for text in texts])
+    db.add(models.User(id=1, cnic="1111111111111", password_hash="x", user_type="citizen"))
+    db.commit()
+
+
+def add_voice_alert(db, priority):
+    alert = models.Alert(user_id=1, alert_type="voice", audio_url="/audio/a.m4a", status="pending",
+                         transcription_status="pending")
+    db.add(alert)
+    db.flush()
+    transcription_queue.enqueue(db, alert.id, "uploads/audio/a.m4a", priority=priority)
+    db.commit()
+    return alert.id
+
+
+def transcribing(result):
+    return lambda alert_id, audio_path, **kwargs: dict(result)
+
+
+def run_claimed(db):
+    """Run one claimed job through transcription, then the keyword stage"""
+    for job in transcription_queue.claim_jobs(db):
+        transcription_queue.run_job(job)
+    items = []
+    while not transcription_queue._keyword_queue.empty():
+        items.append(transcription_queue._keyword_queue.get())
+    if items:
+        transcription_queue.complete_with_keywords(items)
+
+
+def test_claims_highest_priority_first_and_only_once(db):
+    backlog = add_voice_alert(db, transcription_queue.PRIORITY_RECOVERED)
+    live = add_voice_alert(db, transcription_queue.PRIORITY_LIVE)
+    extra = add_voice_alert(db, transcription_queue.PRIORITY_LIVE)
+
+    assert [job.alert_id for job in transcription_queue.claim_jobs(db)] == [live]
+    assert [job.alert_id for job in transcription_queue.claim_jobs(db, 5)] == [extra, backlog]
+    assert transcription_queue.claim_jobs(db, 5) == []
+
+
+def test_failures_retry_with_backoff_then_fail_the_alert(db, monkeypatch):
+    alert_id = add_voice_alert(db, transcription_queue.PRIORITY_LIVE)
+    monkeypatch.setattr(transcription_queue, "RETRY_BASE_SECONDS", 0)
+
+    monkeypatch.setattr(transcription_queue, "transcribe_in_pool",
+                        transcribing({"error": "model crashed", "retry": True}))
+
+    for attempt in range(1, transcription_queue.MAX_ATTEMPTS + 1):
+        jobs = transcription_queue.claim_jobs(db)
+        assert jobs[0].attempts == attempt
+        transcription_queue.run_job(jobs[0])
+
+    db.expire_all()
+    assert transcription_queue.claim_jobs(db) == []
+    assert db.get(models.Alert, alert_id).transcription_status == "failed"
+    assert transcription_queue.queue_stats(db)["failed"] == 1
+
+
+def test_unreadable_audio_fails_without_retry(db, monkeypatch):
+    alert_id = add_voice_alert(db, transcription_queue.PRIORITY_LIVE)
+
+    monkeypatch.setattr(transcription_queue, "transcribe_in_pool",
+                        transcribing({"error": "Audio file not found", "retry": False}))
+
+    run_claimed(db)
+
+    db.expire_all()
+    assert db.get(models.Alert, alert_id).transcription_status == "failed"
+    assert transcription_queue.claim_jobs(db) == []
+
+
+def test_identical_audio_is_served_from_cache(db, monkeypatch, tmp_path):
+    clip = tmp_path / "clip.m4a"
+    clip.write_bytes(b"same audio bytes")
+    calls = []
+    transcribe = transcribing({"transcription": "help near the bridge"})
+    monkeypatch.setattr(transcription_queue, "transcribe_in_pool",
+                        lambda alert_id, audio_path, **kwargs: calls.append(audio_path) or transcribe(alert_id, audio_path))
+
+    first = add_voice_alert(db, transcription_queue.PRIORITY_LIVE)
+    db.query(models.TranscriptionJob).update({"audio_path": str(clip)})
+    db.commit()
+    run_claimed(db)
+
+    retry = models.Alert(user_id=1, alert_type="voice", audio_url="/audio/b.m4a", status="pending",
+                         transcription_status="pending")
+    db.add(retry)
+    transcription_queue.transcribe_or_enqueue(db, retry, str(clip))
+    db.commit()
+
+    db.expire_all()
+    assert len(calls) == 1
+    assert db.get(models.Alert, first).transcription == "help near the bridge"
+    assert retry.transcription_status == "completed"
+    assert retry.transcription_keywords == "bridge"
+    assert transcription_queue.claim_jobs(db) == []
+
+
+def test_workers_claim_one_job_and_keywords_are_batched(db, monkeypatch):
+    first = add_voice_alert(db, transcription_queue.PRIORITY_LIVE)
+    second = add_voice_alert(db, transcription_queue.PRIORITY_LIVE)
+
+    def lease(alert_id):
+        db.expire_all()
+        return db.query(models.TranscriptionJob).filter_by(alert_id=alert_id).one().leased_until
+
+    renewed = {}
+
+    def transcribe(alert_id, audio_path, on_wait, **kwargs):
+        # A long clip: the lease is extended while it runs
+        before = lease(alert_id)
+        on_wait()
+        renewed[alert_id] = lease(alert_id) > before
+        return {"transcription": f"fire at house {alert_id}"}
+
+    batches = []
+    monkeypatch.setattr(transcription_queue, "transcribe_in_pool", transcribe)
+    monkeypatch.setattr(transcription_queue, "extract_keywords_in_pool",
+                        lambda texts, **kwargs: batches.append(texts) or [["fire"] for _ in texts])
+
+    for _ in range(2):
+        jobs = transcription_queue.claim_jobs(db)
+        assert len(jobs) == 1
+        transcription_queue.run_job(jobs[0])
+    transcription_queue.complete_with_keywords([transcription_queue._keyword_queue.get_nowait() for _ in range(2)])
+
+    db.expire_all()
+    assert renewed == {first: True, second: True}
+    assert batches == [[f"fire at house {first}", f"fire at house {second}"]]
+    assert db.get(models.Alert, second).transcription_keywords == "fire"
+    assert transcription_queue.queue_stats(db)["completed"] == 2
+
+
+def test_cache_evicts_least_recently_used(db, monkeypatch):
+    monkeypatch.setattr(transcription_queue.transcription_cache, "CACHE_MAX_ENTRIES", 2)
+    cache = transcription_queue.transcription_cache
+    for digest in ["a", "b"]:
+        cache.store(db, digest, f"text {digest}", [])
+        db.commit()
+    assert cache.lookup(db, "a")  # "b" is now the least recently used
+    db.commit()
+    cache.store(db, "c", "text c", [])
+    db.commit()
+
+    assert cache.lookup(db, "b") is None
+    assert cache.lookup(db, "a") and cache.lookup(db, "c")
+
+
+class FakeToken:
+    def __init__(self, text, pos, lemma=None, stop=False):
+        self.text, self.pos_, self.lemma_ = text, pos, lemma or text
+        self.is_stop, self.is_punct = stop, pos == "PUNCT"
+
+
+class FakeEnt:
+    def __init__(self, text, label):
+        self.text, self.label_ = text, label
+
+
+class FakeDoc(list):
+    ents = ()
+
+
+def test_keyword_batch_keeps_entity_first_order(monkeypatch):
+    from backend import transcription_service
+
+    def pipe(texts, batch_size):
+        for text in texts:
+            doc = FakeDoc([FakeToken("Men", "NOUN", "man"), FakeToken("are", "AUX", stop=True),
+                           FakeToken("chasing", "VERB", "chase"), FakeToken("men", "NOUN", "man"),
+                           FakeToken("Lahore", "PROPN"), FakeToken("!", "PUNCT")] if text else [])
+            doc.ents = [FakeEnt("Lahore", "GPE"), FakeEnt("Edhi", "ORG")] if text else []
+            yield doc
+
+    nlp = type("FakeNlp", (), {"pipe": staticmethod(pipe)})
+    monkeypatch.setattr(transcription_service, "get_spacy_model", lambda: nlp)
+
+    assert transcription_service.extract_keywords_batch(["men chasing me in Lahore", ""]) == [
+        ["edhi", "man", "chase", "lahore"], []
+    ]
+
+
+class WindowedBackend(TranscriptionBackend):
+    """Only implements transcribe(), so gets the default 30 s windows"""
+
+    def __init__(self):
+        super().__init__("fake")
+        self.windows = []
+
+    def decode(self, audio_path):
+        raise AssertionError("audio is decoded by transcription_service")
+
+    def transcribe(self, audio, prompt=None):
+        self.windows.append((len(audio), prompt))
+        return f"part{len(self.windows)}"
+
+
+class StreamingBackend(WindowedBackend):
+    def transcribe_segments(self, audio, prompt=None):
+        yield "help", 4.0
+        yield "me", 9.5
+
+
+@pytest.mark.parametrize("backend_class", [WindowedBackend, StreamingBackend])
+def test_partials_follow_the_backend(monkeypatch, backend_class):
+    from backend import transcription_service
+    rate = transcription_service.SAMPLE_RATE
+    backend = backend_class()
+    speech = 0.5 * np.sin(np.arange(70 * rate) * 0.05).astype(np.float32)
+    monkeypatch.setattr(transcription_service, "load_audio", lambda path: speech)
+    monkeypatch.setattr(transcription_service, "get_transcription_backend", lambda: backend)
+    partials = []
+
+    text = transcription_service.transcribe_audio("clip.m4a", on_partial=lambda *args: partials.append(args))
+
+    if backend_class is StreamingBackend:
+        assert text == "help me"
+        assert partials == [("help", 4.0, 70.0), ("help me", 9.5, 70.0)]
+    else:
+        # Whole 30 s model windows, not shorter chunks that each cost a full encoder pass,
+        # each prompted with the text before it
+        assert backend.windows == [(30 * rate, None), (30 * rate, "part1"), (10 * rate, "part1 part2")]
+        assert text == "part1 part2 part3"
+        assert [p[1:] for p in partials] == [(30.0, 70.0), (60.0, 70.0), (70.0, 70.0)]
+
+
+@pytest.mark.parametrize("module, setting, value", [
+    (transcription_backends, "DEFAULT_BACKEND", "faster-whisper"),
+    (transcription_backends, "DEFAULT_MODEL", "base"),
+    (audio_preprocessing, "PREPROCESSING_VERSION", 2),
+])
+def test_cache_key_depends_on_what_produced_the_transcript(monkeypatch, tmp_path, module, setting, value):
+    clip = tmp_path / "clip.m4a"
+    clip.write_bytes(b"same audio bytes")
+    cache = transcription_queue.transcription_cache
+    before = cache.audio_digest(str(clip))
+    monkeypatch.setattr(module, setting, value)
+    assert cache.audio_digest(str(clip)) != before
+
+
+def test_broken_pool_is_replaced_once(monkeypatch):
+    import threading
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+    from backend import transcription_service
+    both_submitted = threading.Barrier(2)
+
+    class BrokenPool:
+        def submit(self, fn, *args):
+            both_submitted.wait()
+            future = Future()
+            future.set_exception(BrokenProcessPool())
+            return future
+
+        def shutdown(self, **kwargs):
+            pass
+
+    restarts = []
+    monkeypatch.setattr(transcription_service, "_pool", BrokenPool())
+    monkeypatch.setattr(transcription_service, "start_pool",
+                        lambda processes: restarts.append(setattr(transcription_service, "_pool", BrokenPool())))
+
+    def run():
+        with pytest.raises(BrokenProcessPool):
+            transcription_service._run_in_pool(len, "x")
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(restarts) == 1